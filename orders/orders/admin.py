@@ -1,8 +1,63 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from orders.basket import RESERVED_STATES, release_stock
+from orders.cache import bump_catalog_version
+from orders.documents import refresh_documents
+from orders.offers import refresh_best_offers
+from orders.totals import orders_with_items, refresh_basket_totals, update_totals
 from orders.models import User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, \
-    OrderItem, Contact
+    OrderItem, Contact, ImportJob, ParameterFacet, BestOffer
+
+
+class ProductDocumentsAdmin(admin.ModelAdmin):
+    """
+    Пересобирает документы каталога (ProductInfoDocument) и лучшие
+    предложения (BestOffer) товаров, затронутых правкой, и сбрасывает
+    кеш каталога их магазинов. При удалении пересчитываются суммы заказов,
+    позиции которых удаляются каскадно вместе с товарами.
+    """
+
+    def product_infos(self, obj):
+        raise NotImplementedError
+
+    def affected(self, obj):
+        return list(self.product_infos(obj).values_list("id", "shop_id", "product_id"))
+
+    def refresh(self, affected, order_ids=()):
+        # магазины и продукты берутся до удаления: документы удаленных
+        # товаров удаляются каскадно, а кеш их магазинов и лучшие
+        # предложения их продуктов тоже нужно обновить
+        refresh_documents(product_info_id for product_info_id, _, _ in affected)
+        refresh_best_offers({product_id for _, _, product_id in affected})
+        update_totals(order_ids)
+        bump_catalog_version(*{shop_id for _, shop_id, _ in affected})
+
+    def affected_orders(self, affected):
+        return orders_with_items([row[0] for row in affected])
+
+    def save_model(self, request, obj, form, change):
+        # до сохранения: товар мог сменить продукт, и лучшее предложение
+        # прежнего продукта тоже нужно пересчитать
+        obj._affected_before_save = self.affected(obj) if change else []
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        before = getattr(form.instance, "_affected_before_save", [])
+        self.refresh(list(set(before) | set(self.affected(form.instance))))
+
+    def delete_model(self, request, obj):
+        affected = self.affected(obj)
+        order_ids = self.affected_orders(affected)
+        super().delete_model(request, obj)
+        self.refresh(affected, order_ids)
+
+    def delete_queryset(self, request, queryset):
+        affected = [row for obj in queryset for row in self.affected(obj)]
+        order_ids = self.affected_orders(affected)
+        super().delete_queryset(request, queryset)
+        self.refresh(affected, order_ids)
 
 
 @admin.register(User)
@@ -29,38 +84,103 @@ class ShopAdmin(admin.ModelAdmin):
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
-    pass
+class CategoryAdmin(ProductDocumentsAdmin):
+    def product_infos(self, obj):
+        return ProductInfo.objects.filter(product__category_id=obj.id)
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    pass
+class ProductAdmin(ProductDocumentsAdmin):
+    def product_infos(self, obj):
+        return ProductInfo.objects.filter(product_id=obj.id)
 
 
 @admin.register(ProductInfo)
-class ProductInfoAdmin(admin.ModelAdmin):
-    pass
+class ProductInfoAdmin(ProductDocumentsAdmin):
+    def product_infos(self, obj):
+        return ProductInfo.objects.filter(id=obj.id)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # корзины считаются по текущей цене товара
+        refresh_basket_totals([form.instance.id])
 
 
 @admin.register(Parameter)
-class ParameterAdmin(admin.ModelAdmin):
-    pass
+class ParameterAdmin(ProductDocumentsAdmin):
+    def product_infos(self, obj):
+        return ProductInfo.objects.filter(product_parameters__parameter_id=obj.id)
 
 
 @admin.register(ProductParameter)
-class ProductParameterAdmin(admin.ModelAdmin):
-    pass
+class ProductParameterAdmin(ProductDocumentsAdmin):
+    def product_infos(self, obj):
+        return ProductInfo.objects.filter(id=obj.product_info_id)
+
+
+@admin.register(BestOffer)
+class BestOfferAdmin(admin.ModelAdmin):
+    list_display = ('product', 'shop', 'price', 'offers')
+    raw_id_fields = ('product', 'product_info')
+
+
+@admin.register(ParameterFacet)
+class ParameterFacetAdmin(admin.ModelAdmin):
+    list_display = ('shop', 'category', 'parameter', 'value', 'count')
+    list_filter = ('shop',)
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    pass
+    """
+    Снимает резерв товаров, когда заказ отправлен, доставлен или отменен;
+    товар отмененного и удаленного заказа возвращается в остаток
+    """
+
+    def save_model(self, request, obj, form, change):
+        state = (
+            Order.objects.filter(id=obj.id).values_list("state", flat=True).first()
+        )
+        super().save_model(request, obj, form, change)
+        if state in RESERVED_STATES and obj.state not in RESERVED_STATES:
+            release_stock(obj.id, restock=obj.state in ("basket", "canceled"))
+
+    def delete_model(self, request, obj):
+        if obj.state in RESERVED_STATES:
+            release_stock(obj.id, restock=True)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for order_id in queryset.filter(state__in=RESERVED_STATES).values_list(
+            "id", flat=True
+        ):
+            release_stock(order_id, restock=True)
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    pass
+    """
+    Пересчитывает суммы заказов отредактированных позиций
+    """
+
+    def save_model(self, request, obj, form, change):
+        order_ids = [obj.order_id]
+        if change:
+            order_ids += OrderItem.objects.filter(id=obj.id).values_list(
+                "order_id", flat=True
+            )
+        super().save_model(request, obj, form, change)
+        update_totals(set(order_ids))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        update_totals([obj.order_id])
+
+    def delete_queryset(self, request, queryset):
+        order_ids = set(queryset.values_list("order_id", flat=True))
+        super().delete_queryset(request, queryset)
+        update_totals(order_ids)
 
 
 @admin.register(Contact)
@@ -68,6 +188,12 @@ class ContactAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'shop_name', 'filename', 'state', 'progress', 'created_at')
+    list_filter = ('state',)
+
+
 # @admin.register(ConfirmEmailToken)
 # class ConfirmEmailTokenAdmin(admin.ModelAdmin):
 #     list_display = ('user', 'key', 'created_at',)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class BackendConfig(AppConfig):
@@ -7,4 +8,8 @@ class BackendConfig(AppConfig):
     def ready(self):
         """
         импортируем сигналы
-        """
\ No newline at end of file
+        """
+        from orders.search import create_search_index
+
+        # таблица поискового индекса не описана моделью
+        post_migrate.connect(create_search_index, sender=self)
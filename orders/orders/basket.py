@@ -0,0 +1,346 @@
+"""
+Пакетные операции с корзиной.
+
+Позиции запроса проверяются целиком по одной выборке товаров и текущих
+позиций корзины и записываются одним запросом в транзакции. При
+добавлении ошибка в любой строке оставляет корзину без изменений, а в
+ответе перечисляются все отклоненные строки. Изменение количества и
+удаление применяются к допустимым позициям и возвращают отклоненные id.
+Сумма корзины меняется на разницу тем же транзакционным блоком.
+Оформление корзины переносит количество товаров из доступного остатка
+в резерв (checkout). Прайс поставщика учитывает заказ только после
+отправки, поэтому импорт вычитает резерв из количества в прайсе, а
+резерв снимается, когда заказ покидает статусы RESERVED_STATES.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from orders.cache import bump_catalog_version
+from orders.documents import refresh_documents
+from orders.models import Order, OrderItem, ProductInfo
+from orders.offers import refresh_best_offers
+from orders.totals import add_to_totals, freeze_prices
+
+BASKET_BATCH_SIZE = 1000
+# статусы оформленного заказа, товар которого еще числится у поставщика
+RESERVED_STATES = ("new", "confirmed", "assembled")
+
+
+class BasketError(ValueError):
+    """
+    Отклоненные строки запроса: список {"line", "product_info", "Error"}
+    """
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def line_error(line, product_info_id, message):
+    return {"line": line, "product_info": product_info_id, "Error": message}
+
+
+def requested_quantities(items):
+    """
+    id товара -> количество из строк запроса; строки с одним товаром
+    складываются
+    """
+    if not isinstance(items, list):
+        raise BasketError([line_error(None, None, "Ожидается список позиций")])
+    quantities = {}
+    errors = []
+    for line, item in enumerate(items):
+        product_info_id = item.get("product_info") if isinstance(item, dict) else None
+        quantity = item.get("quantity") if isinstance(item, dict) else None
+        if type(product_info_id) != int:
+            errors.append(line_error(line, product_info_id, "Неверный id товара"))
+        elif type(quantity) != int or quantity < 1:
+            errors.append(line_error(line, product_info_id, "Неверное количество"))
+        else:
+            quantities[product_info_id] = quantities.get(product_info_id, 0) + quantity
+    if errors:
+        raise BasketError(errors)
+    return quantities
+
+
+def add_to_basket(user_id, items):
+    """
+    Добавляет позиции в корзину пользователя; количество товара, который
+    уже лежит в корзине, увеличивается.
+    Возвращает (создано позиций, обновлено позиций).
+    """
+    quantities = requested_quantities(items)
+    with transaction.atomic():
+        # параллельные добавления в одну корзину выполняются по очереди,
+        # иначе обе транзакции сложат количество с одним и тем же остатком
+        basket = Order.objects.select_for_update().get_or_create(
+            user_id=user_id, state="basket"
+        )[0]
+        stock = {}
+        prices = {}
+        for product_info_id, quantity, price in ProductInfo.objects.filter(
+            id__in=quantities, is_active=True
+        ).values_list("id", "quantity", "price"):
+            stock[product_info_id] = quantity
+            prices[product_info_id] = price
+        in_basket = dict(
+            OrderItem.objects.filter(
+                order_id=basket.id, product_info_id__in=quantities
+            ).values_list("product_info_id", "quantity")
+        )
+
+        errors = []
+        for line, item in enumerate(items):
+            product_info_id = item["product_info"]
+            total = quantities[product_info_id] + in_basket.get(product_info_id, 0)
+            if product_info_id not in stock:
+                errors.append(line_error(line, product_info_id, "Товар не найден"))
+            elif total > stock[product_info_id]:
+                errors.append(
+                    line_error(
+                        line,
+                        product_info_id,
+                        f"Недостаточно товара: доступно {stock[product_info_id]}",
+                    )
+                )
+        if errors:
+            raise BasketError(errors)
+
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order_id=basket.id,
+                    product_info_id=product_info_id,
+                    quantity=quantity + in_basket.get(product_info_id, 0),
+                )
+                for product_info_id, quantity in quantities.items()
+            ],
+            batch_size=BASKET_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["order", "product_info"],
+            update_fields=["quantity"],
+        )
+        add_to_totals(
+            basket.id,
+            sum(
+                quantity * prices[product_info_id]
+                for product_info_id, quantity in quantities.items()
+            ),
+            sum(quantities.values()),
+        )
+    updated = len(in_basket)
+    return len(quantities) - updated, updated
+
+
+def rejected_item(order_item_id, message):
+    return {"id": order_item_id, "Error": message}
+
+
+def update_basket(user_id, items):
+    """
+    Меняет количество позиций корзины одним UPDATE с CASE по id (bulk_update).
+    Позиции с неверным id или количеством, чужие и сверх остатка не
+    меняются. Возвращает (обновлено позиций, отклоненные id).
+    """
+    if not isinstance(items, list):
+        raise BasketError([rejected_item(None, "Ожидается список позиций")])
+    quantities = {}
+    rejected = []
+    for item in items:
+        order_item_id = item.get("id") if isinstance(item, dict) else None
+        quantity = item.get("quantity") if isinstance(item, dict) else None
+        if type(order_item_id) != int:
+            rejected.append(rejected_item(order_item_id, "Неверный id позиции"))
+        elif type(quantity) != int or quantity < 1:
+            rejected.append(rejected_item(order_item_id, "Неверное количество"))
+        else:
+            quantities[order_item_id] = quantity
+
+    with transaction.atomic():
+        basket = Order.objects.select_for_update().get_or_create(
+            user_id=user_id, state="basket"
+        )[0]
+        stock = {}
+        current = {}
+        for order_item_id, quantity, in_stock, price in OrderItem.objects.filter(
+            order_id=basket.id, id__in=quantities
+        ).values_list(
+            "id", "quantity", "product_info__quantity", "product_info__price"
+        ):
+            stock[order_item_id] = in_stock
+            current[order_item_id] = (quantity, price)
+        updated = []
+        for order_item_id, quantity in quantities.items():
+            if order_item_id not in stock:
+                rejected.append(rejected_item(order_item_id, "Позиция не найдена"))
+            elif quantity > stock[order_item_id]:
+                rejected.append(
+                    rejected_item(
+                        order_item_id,
+                        f"Недостаточно товара: доступно {stock[order_item_id]}",
+                    )
+                )
+            else:
+                updated.append(OrderItem(id=order_item_id, quantity=quantity))
+        OrderItem.objects.bulk_update(
+            updated, ["quantity"], batch_size=BASKET_BATCH_SIZE
+        )
+        if updated:
+            add_to_totals(
+                basket.id,
+                sum(
+                    (item.quantity - current[item.id][0]) * current[item.id][1]
+                    for item in updated
+                ),
+                sum(item.quantity - current[item.id][0] for item in updated),
+            )
+    return len(updated), rejected
+
+
+def remove_from_basket(user_id, order_item_ids):
+    """
+    Удаляет позиции корзины одним DELETE по списку id. Возвращает
+    (удалено позиций, отклоненные id).
+    """
+    ids = []
+    rejected = []
+    for order_item_id in order_item_ids:
+        if order_item_id.strip().isdigit():
+            ids.append(int(order_item_id))
+        else:
+            rejected.append(rejected_item(order_item_id, "Неверный id позиции"))
+
+    with transaction.atomic():
+        basket = Order.objects.select_for_update().get_or_create(
+            user_id=user_id, state="basket"
+        )[0]
+        found = {
+            order_item_id: (quantity, price)
+            for order_item_id, quantity, price in OrderItem.objects.filter(
+                order_id=basket.id, id__in=ids
+            ).values_list("id", "quantity", "product_info__price")
+        }
+        rejected += [
+            rejected_item(order_item_id, "Позиция не найдена")
+            for order_item_id in dict.fromkeys(ids)
+            if order_item_id not in found
+        ]
+        deleted = 0
+        if found:
+            deleted = OrderItem.objects.filter(id__in=found).delete()[0]
+            add_to_totals(
+                basket.id,
+                -sum(quantity * price for quantity, price in found.values()),
+                -sum(quantity for quantity, _ in found.values()),
+            )
+    return deleted, rejected
+
+
+def reserve_stock(lines):
+    """
+    Резервирует товары позиций [(id позиции, id товара, количество)]
+    условными UPDATE quantity = quantity - n, reserved = reserved + n
+    WHERE quantity >= n. Строки ProductInfo блокируются по возрастанию id,
+    поэтому встречные оформления не взаимоблокируются. Возвращает позиции,
+    для которых товара не хватило.
+    """
+    failed = []
+    for order_item_id, product_info_id, quantity in sorted(
+        lines, key=lambda line: line[1]
+    ):
+        reserved = ProductInfo.objects.filter(
+            id=product_info_id, is_active=True, quantity__gte=quantity
+        ).update(
+            quantity=F("quantity") - quantity, reserved=F("reserved") + quantity
+        )
+        if not reserved:
+            failed.append((order_item_id, product_info_id, quantity))
+    return failed
+
+
+def checkout(user_id, order_id, contact_id):
+    """
+    Оформляет корзину: резервирует товары всех позиций, фиксирует цены и
+    переводит заказ в статус "new" одной транзакцией. Если товара не хватило
+    хотя бы по одной позиции, ничего не меняется, а BasketError перечисляет
+    эти позиции с доступным остатком. Возвращает False, если корзины нет.
+    """
+    with transaction.atomic():
+        basket = (
+            Order.objects.select_for_update()
+            .filter(id=order_id, user_id=user_id, state="basket")
+            .first()
+        )
+        if basket is None:
+            return False
+        lines = list(
+            OrderItem.objects.filter(order_id=basket.id).values_list(
+                "id", "product_info_id", "quantity"
+            )
+        )
+        if not lines:
+            raise BasketError([rejected_item(None, "Корзина пуста")])
+        failed = reserve_stock(lines)
+        if failed:
+            # исключение откатывает резерв, уже сделанный по другим позициям
+            available = dict(
+                ProductInfo.objects.filter(
+                    id__in=[line[1] for line in failed], is_active=True
+                ).values_list("id", "quantity")
+            )
+            raise BasketError(
+                [
+                    {
+                        "id": order_item_id,
+                        "product_info": product_info_id,
+                        "Error": "Недостаточно товара: "
+                        f"доступно {available.get(product_info_id, 0)}",
+                    }
+                    for order_item_id, product_info_id, quantity in failed
+                ]
+            )
+
+        Order.objects.filter(id=basket.id).update(
+            contact_id=contact_id, state="new", updated_at=timezone.now()
+        )
+        # сумма оформленного заказа больше не зависит от цен в каталоге
+        freeze_prices(basket.id)
+        stock_changed([line[1] for line in lines])
+    return True
+
+
+def release_stock(order_id, restock=False):
+    """
+    Снимает резерв позиций заказа, который покинул RESERVED_STATES.
+    Отправленный заказ поставщик уже вычел из своего прайса, а товар
+    отмененного заказа (restock) возвращается в доступный остаток.
+    """
+    lines = sorted(
+        OrderItem.objects.filter(order_id=order_id).values_list(
+            "product_info_id", "quantity"
+        )
+    )
+    for product_info_id, quantity in lines:
+        restocked = {"quantity": F("quantity") + quantity} if restock else {}
+        ProductInfo.objects.filter(id=product_info_id, reserved__gte=quantity).update(
+            reserved=F("reserved") - quantity, **restocked
+        )
+    if restock:
+        stock_changed([product_info_id for product_info_id, _ in lines])
+
+
+def stock_changed(product_info_ids):
+    """
+    Обновляет данные каталога, которые зависят от остатков: документы
+    товаров, лучшие предложения продуктов и кеш ответов их магазинов
+    """
+    rows = list(
+        ProductInfo.objects.filter(id__in=product_info_ids).values_list(
+            "shop_id", "product_id"
+        )
+    )
+    refresh_documents(product_info_ids)
+    refresh_best_offers({product_id for _, product_id in rows})
+    shop_ids = {shop_id for shop_id, _ in rows}
+    bump_catalog_version(*shop_ids)
@@ -0,0 +1,146 @@
+"""
+Кеш ответов каталога и условные GET-запросы.
+
+Ключ ответа содержит версию каталога: общую или магазина из запроса.
+Версии хранятся в базе (Shop.catalog_version и CatalogVersion) и
+увеличиваются в той же транзакции, что меняет каталог, поэтому импорт в
+воркере import_worker сразу виден всем веб-процессам. Старые записи кеша
+просто перестают запрашиваться, перебирать ключи не нужно. Из тех же
+версий (и из времени изменения заказов) строятся ETag ответов; версия
+читается один раз за запрос и передается и в ETag, и в ключ кеша.
+"""
+from hashlib import md5
+
+from django.core.cache import cache
+from django.db.models import Count, F, Max
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from orders.models import CatalogVersion, Shop
+
+CATALOG_CACHE_TIMEOUT = 600
+# первичный ключ строки общей версии каталога
+GLOBAL_VERSION = 1
+
+
+def catalog_version(shop_id=None):
+    """
+    Версия каталога магазина shop_id или общая версия; для несуществующего
+    магазина - 0
+    """
+    if shop_id:
+        if not str(shop_id).isdigit():
+            return 0
+        versions = Shop.objects.filter(id=shop_id).values_list(
+            "catalog_version", flat=True
+        )
+    else:
+        versions = CatalogVersion.objects.filter(id=GLOBAL_VERSION).values_list(
+            "version", flat=True
+        )
+    return versions.first() or 0
+
+
+def bump_catalog_version(*shop_ids):
+    """
+    Помечает устаревшими закешированные ответы по всем магазинам
+    и по магазинам shop_ids. Вызывается внутри транзакции, изменившей
+    каталог: новая версия видна другим процессам вместе с данными.
+    """
+    # строки блокируются в одном порядке: магазины по id, затем общая
+    for shop_id in sorted(set(shop_ids)):
+        Shop.objects.filter(id=shop_id).update(
+            catalog_version=F("catalog_version") + 1
+        )
+    if not CatalogVersion.objects.filter(id=GLOBAL_VERSION).update(
+        version=F("version") + 1
+    ):
+        CatalogVersion.objects.bulk_create(
+            [CatalogVersion(id=GLOBAL_VERSION, version=1)], ignore_conflicts=True
+        )
+
+
+def count(name):
+    key = f"catalog:{name}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def cache_stats():
+    return {
+        "hits": cache.get("catalog:hits", 0),
+        "misses": cache.get("catalog:misses", 0),
+    }
+
+
+def cached_catalog(request, version, build):
+    """
+    Возвращает данные ответа каталога версии version (catalog_version)
+    из кеша или строит их функцией build
+    """
+    uri = md5(request.build_absolute_uri().encode()).hexdigest()
+    key = f"catalog:{version}:{uri}"
+    data = cache.get(key)
+    if data is not None:
+        count("hits")
+        return data
+    count("misses")
+    data = build()
+    cache.set(key, data, CATALOG_CACHE_TIMEOUT)
+    return data
+
+
+def make_etag(*parts):
+    return '"%s"' % md5(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def catalog_etag(request, version):
+    """
+    ETag ответа каталога версии version. JSON и browsable API по одному
+    адресу отдают разные тела, поэтому в ETag входит формат ответа
+    """
+    return make_etag(
+        version, request.accepted_renderer.format, request.build_absolute_uri()
+    )
+
+
+def orders_etag(request, orders):
+    """
+    ETag списка заказов: количество и последнее изменение заказов и их
+    контактов одним агрегатом плюс версия каталога, так как в ответе есть
+    цены товаров
+    """
+    state = orders.aggregate(
+        count=Count("id"),
+        updated_at=Max("updated_at"),
+        contact_updated_at=Max("contact__updated_at"),
+    )
+    return make_etag(
+        request.user.id,
+        state["count"],
+        state["updated_at"],
+        state["contact_updated_at"],
+        catalog_version(),
+        request.accepted_renderer.format,
+        request.build_absolute_uri(),
+    )
+
+
+def conditional_response(request, etag, build):
+    """
+    Отвечает 304, если клиент прислал актуальный ETag, иначе строит ответ
+    функцией build. Сериализатор при совпадении ETag не вызывается.
+    Формат ответа выбирается по Accept, поэтому ответ помечается Vary: Accept.
+    """
+    tags = parse_etags(request.headers.get("If-None-Match", ""))
+    if "*" in tags or etag in [tag.removeprefix("W/") for tag in tags]:
+        response = HttpResponseNotModified()
+    else:
+        response = build()
+    response["ETag"] = etag
+    patch_vary_headers(response, ("Accept",))
+    return response
@@ -0,0 +1,70 @@
+"""
+Read-модель каталога: готовый JSON каждого ProductInfo.
+
+Документ совпадает с выводом ProductInfoSerializer, но собирается из
+values_list без моделей и вложенных сериализаторов (orders.fastpath).
+Список /products склеивает сохраненные документы (см. CatalogJSONRenderer).
+Документы пересобирает импорт прайса для измененных товаров и админка
+при правках; команда check_product_documents сверяет их с нормализованными
+таблицами.
+"""
+from rest_framework.renderers import JSONRenderer
+
+from orders.fastpath import product_info_items
+from orders.models import ProductInfoDocument
+from orders.renderers import Documents
+
+DOCUMENT_CHUNK_SIZE = 1000
+
+renderer = JSONRenderer()
+
+
+def build_documents(product_info_ids):
+    """
+    id товара -> JSON товара в формате ProductInfoSerializer
+    """
+    return {
+        product_info_id: renderer.render(item).decode()
+        for product_info_id, item in product_info_items(product_info_ids).items()
+    }
+
+
+def refresh_documents(product_info_ids, batch_size=DOCUMENT_CHUNK_SIZE):
+    """
+    Пересобирает документы товаров; документы удаленных товаров удаляются
+    каскадно вместе с ProductInfo
+    """
+    product_info_ids = list(product_info_ids)
+    for start in range(0, len(product_info_ids), batch_size):
+        documents = build_documents(product_info_ids[start : start + batch_size])
+        ProductInfoDocument.objects.bulk_create(
+            [
+                ProductInfoDocument(product_info_id=product_info_id, document=document)
+                for product_info_id, document in documents.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["product_info"],
+            update_fields=["document"],
+        )
+    return len(product_info_ids)
+
+
+def page_documents(product_infos):
+    """
+    Документы страницы товаров, прочитанных с select_related("document").
+    Отсутствующие документы (товар еще не пересобран) строятся на лету.
+    """
+    missing = [
+        product_info.id
+        for product_info in product_infos
+        if not hasattr(product_info, "document")
+    ]
+    built = build_documents(missing) if missing else {}
+    return Documents(
+        (
+            product_info.document.document
+            if product_info.id not in built
+            else built[product_info.id]
+        ).encode()
+        for product_info in product_infos
+    )
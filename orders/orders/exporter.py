@@ -0,0 +1,103 @@
+"""
+Потоковая выгрузка каталога магазина в схеме data/shop1.yaml
+"""
+from ujson import dumps as dump_json
+from yaml import dump as dump_yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+from orders.models import Category, ProductInfo, ProductParameter
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_goods(shop, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Отдает товары магазина пачками. Строки читаются курсором через
+    .iterator(), параметры подгружаются одним запросом на пачку.
+    """
+    rows = (
+        ProductInfo.objects.filter(shop_id=shop.id, is_active=True)
+        .order_by("id")
+        .values_list(
+            "id",
+            "product__category_id",
+            "product__name",
+            "price",
+            "price_rrc",
+            "quantity",
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield with_parameters(batch)
+            batch = []
+    if batch:
+        yield with_parameters(batch)
+
+
+def with_parameters(rows):
+    parameters = {}
+    for product_info_id, name, value in ProductParameter.objects.filter(
+        product_info_id__in=[row[0] for row in rows]
+    ).values_list("product_info_id", "parameter__name", "value"):
+        parameters.setdefault(product_info_id, {})[name] = value
+    return [
+        {
+            "id": product_info_id,
+            "category": category_id,
+            "name": name,
+            "price": price,
+            "price_rrc": price_rrc,
+            "quantity": quantity,
+            "parameters": parameters.get(product_info_id, {}),
+        }
+        for product_info_id, category_id, name, price, price_rrc, quantity in rows
+    ]
+
+
+def export_categories(shop):
+    return list(
+        Category.objects.filter(products__product_infos__shop_id=shop.id)
+        .distinct()
+        .order_by("id")
+        .values("id", "name")
+    )
+
+
+def yaml_chunks(shop):
+    yield dump_yaml(
+        {"shop": shop.name, "categories": export_categories(shop)},
+        Dumper=SafeDumper,
+        allow_unicode=True,
+        sort_keys=False,
+    )
+    yield "goods:\n"
+    for goods in export_goods(shop):
+        yield dump_yaml(
+            goods, Dumper=SafeDumper, allow_unicode=True, sort_keys=False
+        )
+
+
+def jsonl_chunks(shop):
+    header = {"shop": shop.name, "categories": export_categories(shop)}
+    yield dump_json(header, ensure_ascii=False, escape_forward_slashes=False)
+    yield "\n"
+    for goods in export_goods(shop):
+        yield "".join(
+            dump_json(item, ensure_ascii=False, escape_forward_slashes=False) + "\n"
+            for item in goods
+        )
+
+
+# формат -> (генератор частей файла, content type)
+EXPORT_FORMATS = {
+    "yaml": (yaml_chunks, "application/x-yaml"),
+    "jsonl": (jsonl_chunks, "application/x-ndjson"),
+}
@@ -0,0 +1,106 @@
+"""
+Фильтры по параметрам товаров и счетчики значений (фасеты).
+
+Фильтр передается в запросе как param[<имя параметра>]=<значение>: несколько
+значений одного параметра объединяются через ИЛИ, разные параметры - через И.
+Счетчики значений считаются по товарам текущей выборки. Если выборка
+ограничена только магазином и категорией, счетчики берутся из таблицы
+ParameterFacet, которую пересчитывает импорт прайса, и запрос каталога не
+группирует ProductParameter. С остальными фильтрами (цена, наличие, param[...],
+q, id) значения параметров группируются по отфильтрованным товарам.
+"""
+import re
+
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+
+from orders.models import ParameterFacet, ProductParameter
+
+PARAM_RE = re.compile(r"^param\[(.+)\]$")
+FACET_BATCH_SIZE = 1000
+
+
+def parameter_filters(query_params):
+    """
+    Имя параметра -> список допустимых значений из строки запроса
+    """
+    filters = {}
+    for key in query_params:
+        match = PARAM_RE.match(key)
+        if match:
+            values = [value for value in query_params.getlist(key) if value != ""]
+            if values:
+                filters[match.group(1)] = values
+    return filters
+
+
+def parameter_query(filters):
+    query = Q()
+    for name, values in filters.items():
+        query &= Exists(
+            ProductParameter.objects.filter(
+                product_info_id=OuterRef("pk"), parameter__name=name, value__in=values
+            )
+        )
+    return query
+
+
+def facet_summary(shop_id=None, category_id=None):
+    """
+    Имя параметра -> {значение: количество товаров} для магазина
+    и категории (или для всего каталога)
+    """
+    facets = ParameterFacet.objects.all()
+    if shop_id:
+        facets = facets.filter(shop_id=shop_id)
+    if category_id:
+        facets = facets.filter(category_id=category_id)
+    summary = {}
+    for name, value, total in (
+        facets.values_list("parameter__name", "value")
+        .annotate(total=Sum("count"))
+        .order_by("parameter__name", "-total", "value")
+    ):
+        summary.setdefault(name, {})[value] = total
+    return summary
+
+
+def facet_counts(product_infos):
+    """
+    Имя параметра -> {значение: количество товаров} по queryset product_infos
+    """
+    summary = {}
+    for name, value, total in (
+        ProductParameter.objects.filter(product_info__in=product_infos.values("id"))
+        .values_list("parameter__name", "value")
+        .annotate(total=Count("id"))
+        .order_by("parameter__name", "-total", "value")
+    ):
+        summary.setdefault(name, {})[value] = total
+    return summary
+
+
+def refresh_facets(shop_id):
+    """
+    Пересчитывает счетчики магазина по активным товарам
+    """
+    ParameterFacet.objects.filter(shop_id=shop_id).delete()
+    rows = (
+        ProductParameter.objects.filter(
+            product_info__shop_id=shop_id, product_info__is_active=True
+        )
+        .values_list("product_info__product__category_id", "parameter_id", "value")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    facets = [
+        ParameterFacet(
+            shop_id=shop_id,
+            category_id=category_id,
+            parameter_id=parameter_id,
+            value=value,
+            count=count,
+        )
+        for category_id, parameter_id, value, count in rows
+    ]
+    ParameterFacet.objects.bulk_create(facets, batch_size=FACET_BATCH_SIZE)
+    return len(facets)
@@ -0,0 +1,154 @@
+"""
+Быстрая сериализация списков заказов.
+
+Строки читаются через values_list, ответ собирается из словарей в формате
+OrderSerializer и рендерится ujson, без моделей и вложенных ModelSerializer.
+Вывод совпадает побайтно с JSONRenderer (см. команду check_fastpath).
+Включается настройкой FAST_SERIALIZATION.
+"""
+from rest_framework.fields import DateTimeField
+from ujson import dumps as dump_json
+
+from orders.models import Contact, OrderItem, ProductInfo, ProductParameter
+from orders.totals import shop_totals
+
+CONTACT_FIELDS = (
+    "id",
+    "city",
+    "street",
+    "house",
+    "structure",
+    "building",
+    "apartment",
+    "phone",
+)
+
+ORDER_FIELDS = (
+    "id",
+    "ordered_items",
+    "state",
+    "dt",
+    "total_sum",
+    "items_count",
+    "contact",
+)
+
+datetime_field = DateTimeField()
+
+
+def render_json(data):
+    """
+    ujson с теми же настройками вывода, что у JSONRenderer
+    """
+    return (
+        dump_json(data, ensure_ascii=False, escape_forward_slashes=False)
+        .replace("\u2028", "\\u2028")
+        .replace("\u2029", "\\u2029")
+        .encode()
+    )
+
+
+def product_info_items(product_info_ids):
+    """
+    id товара -> товар в формате ProductInfoSerializer
+    """
+    items = {}
+    for (
+        product_info_id,
+        name,
+        category,
+        shop_id,
+        quantity,
+        price,
+        price_rrc,
+    ) in ProductInfo.objects.filter(id__in=product_info_ids).values_list(
+        "id",
+        "product__name",
+        "product__category__name",
+        "shop_id",
+        "quantity",
+        "price",
+        "price_rrc",
+    ):
+        items[product_info_id] = {
+            "id": product_info_id,
+            "product": {"name": name, "category": category},
+            "shop": shop_id,
+            "quantity": quantity,
+            "price": price,
+            "price_rrc": price_rrc,
+            "product_parameters": [],
+        }
+    for product_info_id, parameter, value in (
+        ProductParameter.objects.filter(product_info_id__in=items)
+        .order_by("id")
+        .values_list("product_info_id", "parameter__name", "value")
+    ):
+        items[product_info_id]["product_parameters"].append(
+            {"parameter": parameter, "value": value}
+        )
+    return items
+
+
+def order_rows(orders, fields=None, shop_user_id=None):
+    """
+    Заказы в формате OrderSerializer. orders - queryset заказов с фильтрами
+    view; запросов всегда четыре-пять, независимо от числа заказов. fields -
+    поля для вывода (None - все), позиции и контакты читаются, только если
+    они запрошены. С shop_user_id суммы считаются только по позициям
+    магазина этого пользователя (orders.totals.shop_totals).
+    """
+    if fields is None:
+        fields = ORDER_FIELDS
+    rows = list(
+        orders.distinct().values_list(
+            "id", "state", "dt", "total_sum", "items_count", "contact_id"
+        )
+    )
+    order_ids = [row[0] for row in rows]
+    if shop_user_id is not None and {"total_sum", "items_count"} & set(fields):
+        totals = shop_totals(order_ids, shop_user_id)
+        rows = [row[:3] + totals[row[0]] + row[5:] for row in rows]
+
+    ordered_items = {order_id: [] for order_id in order_ids}
+    if "ordered_items" in fields:
+        item_rows = list(
+            OrderItem.objects.filter(order_id__in=order_ids)
+            .order_by("id")
+            .values_list("order_id", "id", "product_info_id", "quantity")
+        )
+        product_infos = product_info_items({row[2] for row in item_rows})
+        for order_id, item_id, product_info_id, quantity in item_rows:
+            ordered_items[order_id].append(
+                {
+                    "id": item_id,
+                    "product_info": product_infos[product_info_id],
+                    "quantity": quantity,
+                }
+            )
+
+    contacts = {}
+    if "contact" in fields:
+        contact_ids = {row[5] for row in rows if row[5] is not None}
+        contacts = {
+            contact["id"]: contact
+            for contact in Contact.objects.filter(id__in=contact_ids).values(
+                *CONTACT_FIELDS
+            )
+        }
+    return [
+        {
+            name: value
+            for name, value in (
+                ("id", order_id),
+                ("ordered_items", ordered_items[order_id]),
+                ("state", state),
+                ("dt", datetime_field.to_representation(dt)),
+                ("total_sum", total_sum),
+                ("items_count", items_count),
+                ("contact", contacts.get(contact_id)),
+            )
+            if name in fields
+        }
+        for order_id, state, dt, total_sum, items_count, contact_id in rows
+    ]
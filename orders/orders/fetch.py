@@ -0,0 +1,53 @@
+"""
+Загрузка прайсов поставщиков по ссылке
+"""
+import os
+from collections import namedtuple
+from tempfile import NamedTemporaryFile
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 64 * 1024
+# таймауты на подключение и на чтение очередной порции ответа, секунды
+TIMEOUT = (5, 60)
+
+# одна сессия на процесс: соединения с серверами поставщиков переиспользуются
+session = Session()
+adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
+FetchResult = namedtuple("FetchResult", "path not_modified etag last_modified")
+
+
+def fetch_price_list(url, etag="", last_modified=""):
+    """
+    Скачивает прайс во временный файл, не держа ответ целиком в памяти.
+    Сохраненные ETag и Last-Modified отправляются условными заголовками:
+    если прайс не менялся, сервер отвечает 304 и файл не создается.
+    Удалить временный файл после импорта должен вызывающий код.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 304:
+            return FetchResult(None, True, etag, last_modified)
+        response.raise_for_status()
+        fh = NamedTemporaryFile("wb", prefix="price_", delete=False)
+        try:
+            with fh:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    fh.write(chunk)
+        except Exception:
+            os.unlink(fh.name)
+            raise
+    return FetchResult(
+        fh.name,
+        False,
+        response.headers.get("ETag", ""),
+        response.headers.get("Last-Modified", ""),
+    )
@@ -0,0 +1,597 @@
+"""
+Импорт прайс-листов поставщиков пакетными запросами
+"""
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+
+from orders.cache import bump_catalog_version
+from orders.documents import refresh_documents
+from orders.facets import refresh_facets
+from orders.offers import refresh_best_offers
+from orders.totals import orders_with_items, refresh_basket_totals, update_totals
+from orders.models import (
+    Shop,
+    Category,
+    Product,
+    ProductInfo,
+    Parameter,
+    ProductParameter,
+)
+from orders.search import chunks, search_index
+
+BATCH_SIZE = 1000
+
+# режимы импорта: сравнение с текущим каталогом магазина или полная перезапись
+IMPORT_MODES = ("diff", "replace")
+# id товаров прайса в режиме "diff": временная таблица соединения вместо
+# множества в памяти, которое растет с размером прайса
+SEEN_TABLE = "orders_import_seen"
+
+
+class DimensionCache:
+    """
+    Справочники категорий и параметров в памяти. Продуктов столько же,
+    сколько товаров в каталогах, поэтому в памяти держатся только продукты
+    текущей пачки товаров.
+
+    Экземпляр можно переиспользовать между импортами (import_catalogs держит
+    один на процесс). Недостающие строки создаются через bulk_create
+    с ignore_conflicts в отсортированном порядке, чтобы параллельные импорты
+    не блокировали друг друга, и затем перечитываются из базы: строки,
+    созданные другим процессом, подхватываются без ошибок уникальности.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        # название категории -> id
+        self.categories = {}
+        # (название, id категории) -> id продукта текущей пачки
+        self.products = {}
+        # название параметра -> id
+        self.parameters = {}
+
+    def load(self):
+        self.categories = {
+            name: category_id
+            for category_id, name in Category.objects.values_list("id", "name")
+        }
+        self.parameters = {
+            name: parameter_id
+            for parameter_id, name in Parameter.objects.values_list("id", "name")
+        }
+        self.loaded = True
+
+    def clear(self):
+        """
+        Сбрасывает справочники, например после отката транзакции импорта:
+        в них могли попасть id несохраненных строк
+        """
+        self.loaded = False
+        self.categories = {}
+        self.products = {}
+        self.parameters = {}
+
+    def resolve_categories(self, categories):
+        """
+        Создает недостающие категории. Возвращает соответствие id категорий
+        из прайса id в базе и количество новых категорий. Категория с тем же
+        названием переиспользуется, даже если у поставщика другой id.
+        """
+        missing = sorted(
+            {
+                category["name"]: category["id"]
+                for category in categories
+                if category["name"] not in self.categories
+            }.items()
+        )
+        if missing:
+            Category.objects.bulk_create(
+                [Category(id=category_id, name=name) for name, category_id in missing],
+                ignore_conflicts=True,
+            )
+            for category_id, name in Category.objects.filter(
+                name__in=[name for name, _ in missing]
+            ).values_list("id", "name"):
+                self.categories[name] = category_id
+            for name, category_id in missing:
+                if name not in self.categories:
+                    raise ValueError(
+                        f"Категория {category_id} уже существует с другим названием"
+                    )
+        mapping = {
+            category["id"]: self.categories[category["name"]]
+            for category in categories
+        }
+        return mapping, len(missing)
+
+    def find_products(self, keys):
+        """
+        (название, id категории) -> id для существующих продуктов из keys
+        """
+        return {
+            (name, category_id): product_id
+            for product_id, name, category_id in Product.objects.filter(
+                name__in={name for name, _ in keys},
+                category_id__in={category_id for _, category_id in keys},
+            ).values_list("id", "name", "category_id")
+            if (name, category_id) in keys
+        }
+
+    def resolve_products(self, keys):
+        """
+        Читает и создает продукты пачки товаров, заменяя ими self.products.
+        Возвращает количество новых продуктов.
+        """
+        keys = set(keys)
+        self.products = self.find_products(keys)
+        missing = sorted(keys.difference(self.products))
+        if not missing:
+            return 0
+        Product.objects.bulk_create(
+            [
+                Product(name=name, category_id=category_id)
+                for name, category_id in missing
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        # ignore_conflicts не возвращает первичные ключи, перечитываем их
+        self.products.update(self.find_products(set(missing)))
+        return len(missing)
+
+    def resolve_parameters(self, names):
+        missing = sorted(name for name in names if name not in self.parameters)
+        if not missing:
+            return 0
+        Parameter.objects.bulk_create(
+            [Parameter(name=name) for name in missing],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        for parameter_id, name in Parameter.objects.filter(
+            name__in=missing
+        ).values_list("id", "name"):
+            self.parameters[name] = parameter_id
+        return len(missing)
+
+
+class CatalogImporter:
+    """
+    Загрузка прайса поставщика в базу.
+
+    Справочники категорий, продуктов и параметров читаются в память один раз,
+    товары поступают потоком записей и пишутся через bulk_create пачками
+    по batch_size внутри одной транзакции. После импорта доступны время
+    и количество строк по фазам.
+
+    В режиме "diff" товары сопоставляются с каталогом магазина по id
+    поставщика: меняются только строки с новой ценой, количеством или
+    параметрами, отсутствующие в прайсе товары снимаются с продажи
+    (is_active=False). id товаров прайса копятся во временной таблице
+    SEEN_TABLE. Количество в прайсе включает еще не отправленные
+    заказы, поэтому в остаток пишется количество за вычетом резерва
+    (ProductInfo.reserved). В режиме "replace" каталог магазина удаляется
+    и создается заново.
+
+    Поисковый индекс обновляется в той же транзакции: переиндексируются
+    только новые товары и товары с другим продуктом или параметрами.
+    Счетчики фильтров (ParameterFacet) магазина пересчитываются в конце
+    импорта, если каталог изменился. Документы каталога (ProductInfoDocument)
+    пересобираются для новых и измененных товаров. Лучшие предложения
+    (BestOffer) пересчитываются после каждой пачки для продуктов, у товаров
+    которых изменились цена, количество, продукт или активность. Суммы
+    корзин с товарами, у которых изменилась цена, пересчитываются там же;
+    в режиме "replace" пересчитываются все заказы с товарами магазина.
+    Поэтому, кроме справочников категорий и параметров, память импорта не
+    зависит от размера прайса.
+    """
+
+    def __init__(
+        self, batch_size=BATCH_SIZE, mode="diff", on_batch=None, dimensions=None
+    ):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Неизвестный режим импорта: {mode}")
+        self.batch_size = batch_size
+        self.mode = mode
+        # вызывается после записи каждой пачки товаров (прогресс задачи импорта)
+        self.on_batch = on_batch
+        self.timings = {}
+        self.counts = {}
+        if mode == "diff":
+            self.counts = dict.fromkeys(
+                ("inserted", "updated", "unchanged", "retired"), 0
+            )
+        # магазин из заголовка прайса, заполняется во время импорта
+        self.shop = None
+        self.dimensions = dimensions if dimensions is not None else DimensionCache()
+        # id категории в прайсе -> id категории в базе
+        self.category_ids = {}
+        # продукты текущей пачки, лучшее предложение которых нужно пересчитать
+        self.offer_products = set()
+        # товары текущей пачки с новой ценой: суммы их корзин пересчитываются
+        self.repriced = []
+        # None, если база не поддерживает полнотекстовый поиск
+        self.search_index = search_index()
+
+    @contextmanager
+    def phase(self, name):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + perf_counter() - started
+
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def report(self):
+        return {
+            "Timings": {name: round(value, 3) for name, value in self.timings.items()},
+            "Counts": self.counts,
+        }
+
+    def run(self, records):
+        """
+        Загружает прайс из потока записей ("shop" | "category" | "goods", значение).
+        Категории и товары копятся до batch_size и записываются пачкой,
+        поэтому весь прайс в памяти не держится.
+        """
+        if not self.dimensions.loaded:
+            with self.phase("load"):
+                self.dimensions.load()
+        try:
+            return self.import_records(records)
+        except Exception:
+            self.dimensions.clear()
+            raise
+
+    def import_records(self, records):
+        with transaction.atomic():
+            shop = None
+            categories = []
+            goods = []
+            for kind, value in records:
+                if kind == "shop":
+                    with self.phase("shop"):
+                        shop = Shop.objects.get_or_create(name=value)[0]
+                    self.shop = shop
+                    if self.mode == "replace":
+                        with self.phase("cleanup"):
+                            self.delete_goods(shop)
+                    else:
+                        self.create_seen()
+                elif kind == "category":
+                    categories.append(value)
+                elif kind == "goods":
+                    goods.append(value)
+                    if len(goods) >= self.batch_size:
+                        self.flush(shop, categories, goods)
+            self.flush(shop, categories, goods)
+            if self.mode == "diff" and shop is not None:
+                with self.phase("retire"):
+                    self.retire_missing(shop)
+                self.drop_seen()
+            if shop is not None and self.catalog_changed():
+                with self.phase("facets"):
+                    self.count("facets", refresh_facets(shop.id))
+            if shop is not None:
+                # закешированные ответы каталога устаревают вместе с фиксацией
+                # импорта: версия хранится в базе и меняется в его транзакции
+                bump_catalog_version(shop.id)
+        return self.report()
+
+    def refresh_pending(self, order_ids=()):
+        """
+        Пересчитывает лучшие предложения продуктов и суммы корзин по уже
+        записанным товарам пачки и суммы заказов order_ids
+        """
+        if self.offer_products:
+            with self.phase("offers"):
+                self.count(
+                    "offers", refresh_best_offers(self.offer_products, self.batch_size)
+                )
+            self.offer_products.clear()
+        if self.repriced or order_ids:
+            with self.phase("totals"):
+                drift = refresh_basket_totals(self.repriced, self.batch_size)
+                drift += update_totals(order_ids, self.batch_size)
+                self.count("totals", len(drift))
+            self.repriced.clear()
+
+    def delete_goods(self, shop):
+        """
+        Режим "replace": удаляет каталог магазина пачками. Позиции заказов
+        удаляются каскадно вместе с товарами, поэтому суммы этих заказов
+        и лучшие предложения продуктов пересчитываются сразу.
+        """
+        goods = ProductInfo.objects.filter(shop_id=shop.id).order_by("id")
+        while True:
+            rows = list(goods.values_list("id", "product_id")[: self.batch_size])
+            if not rows:
+                break
+            ids = [product_info_id for product_info_id, _ in rows]
+            order_ids = orders_with_items(ids)
+            self.unindex(ids)
+            self.count("deleted", ProductInfo.objects.filter(id__in=ids).delete()[0])
+            self.offer_products.update(product_id for _, product_id in rows)
+            self.refresh_pending(order_ids)
+
+    def create_seen(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {SEEN_TABLE}"
+                " (id bigint PRIMARY KEY)"
+            )
+            cursor.execute(f"DELETE FROM {SEEN_TABLE}")
+
+    def mark_seen(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEEN_TABLE} (id) VALUES (%s) ON CONFLICT DO NOTHING",
+                [(product_info_id,) for product_info_id in ids],
+            )
+
+    def drop_seen(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {SEEN_TABLE}")
+
+    def catalog_changed(self):
+        if self.mode == "replace":
+            return True
+        return any(self.counts[name] for name in ("inserted", "updated", "retired"))
+
+    def flush(self, shop, categories, goods):
+        if not (categories or goods):
+            return
+        if shop is None:
+            raise ValueError("В прайсе не указан магазин")
+        if categories:
+            with self.phase("categories"):
+                self.import_categories(shop, categories)
+        if goods:
+            self.import_goods(shop, goods)
+            self.refresh_pending()
+            self.count("goods", len(goods))
+            if self.on_batch is not None:
+                self.on_batch(self)
+        categories.clear()
+        goods.clear()
+
+    def import_categories(self, shop, categories):
+        mapping, created = self.dimensions.resolve_categories(categories)
+        self.category_ids.update(mapping)
+        self.count("categories", created)
+
+        shop_link = Category.shops.through
+        shop_link.objects.bulk_create(
+            [
+                shop_link(category_id=category_id, shop_id=shop.id)
+                for category_id in sorted(set(mapping.values()))
+            ],
+            ignore_conflicts=True,
+        )
+
+    def product_key(self, item):
+        category_id = self.category_ids.get(item["category"], item["category"])
+        return item["name"], category_id
+
+    def import_goods(self, shop, items):
+        with self.phase("products"):
+            self.resolve_products(items)
+        with self.phase("parameters"):
+            self.resolve_parameters(items)
+        if self.mode == "replace":
+            changed = reindex = self.write_goods(shop, items)
+        else:
+            changed, reindex = self.write_goods_diff(shop, items)
+        if changed:
+            with self.phase("documents"):
+                self.count("documents", refresh_documents(changed, self.batch_size))
+        if self.search_index is not None and reindex:
+            with self.phase("search"):
+                self.search_index.update(reindex)
+                self.count("indexed", len(reindex))
+
+    def unindex(self, product_info_ids):
+        if self.search_index is None:
+            return
+        for ids in chunks(product_info_ids, self.batch_size):
+            self.search_index.delete(ids)
+
+    def build_product_info(self, shop, item):
+        return ProductInfo(
+            id=item["id"],
+            product_id=self.dimensions.products[self.product_key(item)],
+            shop_id=shop.id,
+            price=item["price"],
+            price_rrc=item["price_rrc"],
+            quantity=item["quantity"],
+        )
+
+    def build_parameters(self, item):
+        # значения приводим к строке так же, как их сохраняет CharField
+        return {
+            self.dimensions.parameters[name]: str(value)
+            for name, value in item["parameters"].items()
+        }
+
+    def write_goods(self, shop, items):
+        with self.phase("product_infos"):
+            ProductInfo.objects.bulk_create(
+                [self.build_product_info(shop, item) for item in items],
+                batch_size=self.batch_size,
+            )
+            self.count("product_infos", len(items))
+            self.offer_products.update(
+                self.dimensions.products[self.product_key(item)] for item in items
+            )
+        self.write_parameters(
+            {item["id"]: self.build_parameters(item) for item in items}
+        )
+        return [item["id"] for item in items]
+
+    def write_parameters(self, parameters):
+        with self.phase("product_parameters"):
+            product_parameters = [
+                ProductParameter(
+                    product_info_id=product_info_id,
+                    parameter_id=parameter_id,
+                    value=value,
+                )
+                for product_info_id, values in parameters.items()
+                for parameter_id, value in values.items()
+            ]
+            ProductParameter.objects.bulk_create(
+                product_parameters, batch_size=self.batch_size
+            )
+            self.count("product_parameters", len(product_parameters))
+
+    def write_goods_diff(self, shop, items):
+        with self.phase("diff"):
+            ids = [item["id"] for item in items]
+            self.mark_seen(ids)
+            existing = {
+                product_info.id: product_info
+                for product_info in ProductInfo.objects.filter(
+                    shop_id=shop.id, id__in=ids
+                ).only(
+                    "product_id",
+                    "price",
+                    "price_rrc",
+                    "quantity",
+                    "reserved",
+                    "is_active",
+                )
+            }
+            existing_parameters = {}
+            for product_info_id, parameter_id, value in (
+                ProductParameter.objects.filter(product_info_id__in=existing)
+                .values_list("product_info_id", "parameter_id", "value")
+            ):
+                existing_parameters.setdefault(product_info_id, {})[
+                    parameter_id
+                ] = value
+
+            new_infos = []
+            changed_infos = []
+            new_parameters = {}
+            # новые и измененные товары
+            changed = []
+            # товары, у которых изменился текст для поискового индекса
+            reindex = []
+            for item in items:
+                product_info = self.build_product_info(shop, item)
+                parameters = self.build_parameters(item)
+                current = existing.get(product_info.id)
+                if current is None:
+                    new_infos.append(product_info)
+                    new_parameters[product_info.id] = parameters
+                    changed.append(product_info.id)
+                    reindex.append(product_info.id)
+                    self.offer_products.add(product_info.product_id)
+                    continue
+                # в прайсе остаток вместе с еще не отправленными заказами
+                available = max(product_info.quantity - current.reserved, 0)
+                row_changed = (
+                    current.product_id,
+                    current.price,
+                    current.price_rrc,
+                    current.quantity,
+                    current.is_active,
+                ) != (
+                    product_info.product_id,
+                    product_info.price,
+                    product_info.price_rrc,
+                    available,
+                    True,
+                )
+                parameters_changed = (
+                    existing_parameters.get(product_info.id, {}) != parameters
+                )
+                if row_changed:
+                    # резерв вычитается в самом UPDATE: оформление между
+                    # чтением и записью не вернет проданный товар в остаток
+                    product_info.quantity = Greatest(
+                        Value(product_info.quantity) - F("reserved"), Value(0)
+                    )
+                    changed_infos.append(product_info)
+                    self.offer_products.update(
+                        (current.product_id, product_info.product_id)
+                    )
+                    if current.price != product_info.price:
+                        self.repriced.append(product_info.id)
+                if parameters_changed:
+                    new_parameters[product_info.id] = parameters
+                if (
+                    parameters_changed
+                    or current.product_id != product_info.product_id
+                    or not current.is_active
+                ):
+                    reindex.append(product_info.id)
+                if row_changed or parameters_changed:
+                    changed.append(product_info.id)
+                    self.count("updated", 1)
+                else:
+                    self.count("unchanged", 1)
+
+        with self.phase("product_infos"):
+            ProductInfo.objects.bulk_create(new_infos, batch_size=self.batch_size)
+            ProductInfo.objects.bulk_update(
+                changed_infos,
+                ["product", "price", "price_rrc", "quantity", "is_active"],
+                batch_size=self.batch_size,
+            )
+            self.count("inserted", len(new_infos))
+        with self.phase("product_parameters"):
+            ProductParameter.objects.filter(
+                product_info_id__in=[
+                    product_info_id
+                    for product_info_id in new_parameters
+                    if product_info_id in existing
+                ]
+            ).delete()
+        self.write_parameters(new_parameters)
+        return changed, reindex
+
+    def retire_missing(self, shop):
+        """
+        Снимает с продажи товары магазина, которых нет в SEEN_TABLE, пачками:
+        снятые товары выпадают из выборки следующей пачки
+        """
+        missing = (
+            ProductInfo.objects.filter(shop_id=shop.id, is_active=True)
+            .exclude(id__in=RawSQL(f"SELECT id FROM {SEEN_TABLE}", []))
+            .order_by("id")
+        )
+        while True:
+            rows = list(missing.values_list("id", "product_id")[: self.batch_size])
+            if not rows:
+                break
+            ids = [product_info_id for product_info_id, _ in rows]
+            ProductInfo.objects.filter(id__in=ids).update(is_active=False)
+            # снятые с продажи товары поиском не находятся
+            self.unindex(ids)
+            self.count("retired", len(ids))
+            self.offer_products.update(product_id for _, product_id in rows)
+            self.refresh_pending()
+
+    def resolve_products(self, items):
+        self.count(
+            "products",
+            self.dimensions.resolve_products(
+                {self.product_key(item) for item in items}
+            ),
+        )
+
+    def resolve_parameters(self, items):
+        self.count(
+            "parameters",
+            self.dimensions.resolve_parameters(
+                {name for item in items for name in item["parameters"]}
+            ),
+        )
@@ -0,0 +1,277 @@
+"""
+Фоновые задачи импорта прайсов
+"""
+import os
+from hashlib import sha256
+from queue import Queue
+from threading import Thread
+from time import sleep
+
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from orders.fetch import fetch_price_list
+from orders.importer import CatalogImporter, IMPORT_MODES
+from orders.models import ImportJob, Shop
+from orders.readers import PRICE_LIST_FORMATS, read_price_list
+from orders.settings import MEDIA_ROOT
+
+# сколько задач из головы очереди просматривает воркер при выборе следующей
+CLAIM_WINDOW = 20
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def price_list_path(filename, format="yaml"):
+    return f"{MEDIA_ROOT}{filename}.{format}"
+
+
+def open_price_list(path):
+    # newline="" нужен модулю csv, остальным форматам он не мешает
+    return open(path, encoding="UTF-8", newline="")
+
+
+def enqueue_import(
+    filename="", url="", format="yaml", mode="diff", force=False, user_id=None
+):
+    """
+    Ставит прайс из файла или по ссылке в очередь на импорт. Магазин
+    определяется заранее (по заголовку файла или по ссылке магазина),
+    чтобы воркеры не запускали два импорта одного магазина одновременно.
+    Задача по новой ссылке получает название магазина после загрузки
+    прайса (rekey_job).
+    С force прайс загружается, даже если он не менялся с прошлого импорта.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Неизвестный режим импорта: {mode}")
+    if format not in PRICE_LIST_FORMATS:
+        raise ValueError(f"Неизвестный формат прайса: {format}")
+    if url:
+        shop = Shop.objects.filter(url=url).first()
+        # магазин новой ссылки станет известен только после загрузки прайса
+        shop_name = shop.name if shop else url[:50]
+    else:
+        with open_price_list(price_list_path(filename, format)) as fh:
+            kind, shop_name = next(read_price_list(fh, format), (None, None))
+        if kind != "shop" or not shop_name:
+            raise ValueError("В прайсе не указан магазин")
+    return ImportJob.objects.create(
+        user_id=user_id,
+        shop_name=shop_name,
+        filename=filename,
+        url=url,
+        format=format,
+        mode=mode,
+        force=force,
+    )
+
+
+def claim_job():
+    """
+    Забирает самую старую задачу магазина, для которого сейчас нет
+    выполняющегося импорта. Частичный уникальный индекс unique_running_import
+    не дает двум воркерам одновременно взять задачи одного магазина.
+    """
+    running = ImportJob.objects.filter(state="running").values("shop_name")
+    candidates = (
+        ImportJob.objects.filter(state="queued")
+        .exclude(shop_name__in=running)
+        .order_by("id")[:CLAIM_WINDOW]
+    )
+    for job in candidates:
+        try:
+            with transaction.atomic():
+                claimed = ImportJob.objects.filter(id=job.id, state="queued").update(
+                    state="running", started_at=timezone.now()
+                )
+        except IntegrityError:
+            # другой воркер уже импортирует этот магазин
+            continue
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+class JobDeferred(Exception):
+    """
+    Задача вернулась в очередь: ее магазин сейчас импортируется другой задачей
+    """
+
+
+def rekey_job(job, shop_name):
+    """
+    Присваивает выполняющейся задаче название магазина из заголовка прайса.
+    Задача по новой ссылке стоит в очереди под ссылкой, и частичный
+    уникальный индекс не видит в ней магазин. Если этот магазин уже
+    импортируется, задача возвращается в очередь под его названием и
+    будет взята после текущего импорта (JobDeferred).
+    """
+    if shop_name == job.shop_name:
+        return
+    try:
+        with transaction.atomic():
+            ImportJob.objects.filter(id=job.id).update(shop_name=shop_name)
+    except IntegrityError:
+        ImportJob.objects.filter(id=job.id).update(
+            state="queued", shop_name=shop_name, progress=0, started_at=None
+        )
+        raise JobDeferred(shop_name)
+    job.shop_name = shop_name
+
+
+def requeue_running():
+    """
+    Возвращает в очередь задачи, оставшиеся в статусе "running" после
+    аварийной остановки воркеров
+    """
+    return ImportJob.objects.filter(state="running").update(
+        state="queued", progress=0, started_at=None
+    )
+
+
+class ProgressReporter(Thread):
+    """
+    Пишет прогресс задачи через отдельное соединение с базой: сам импорт идет
+    в одной транзакции, и его изменения не видны до фиксации
+    """
+
+    def __init__(self, job_id, size):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.size = size
+        self.queue = Queue()
+
+    def report(self, position, importer):
+        progress = min(99, int(position * 100 / self.size)) if self.size else 0
+        self.queue.put((progress, importer.report()))
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        try:
+            while True:
+                item = self.queue.get()
+                # пропускаем устаревшие отметки, пишем только последнюю
+                while item is not None and not self.queue.empty():
+                    item = self.queue.get()
+                if item is None:
+                    break
+                progress, report = item
+                try:
+                    ImportJob.objects.filter(id=self.job_id).update(
+                        progress=progress, report=report
+                    )
+                except DatabaseError:
+                    # прогресс не критичен, например SQLite занят записью импорта
+                    pass
+        finally:
+            connection.close()
+
+
+def import_file(job, path):
+    with open_price_list(path) as fh:
+        reporter = ProgressReporter(job.id, os.fstat(fh.fileno()).st_size)
+        reporter.start()
+        try:
+            importer = CatalogImporter(
+                mode=job.mode,
+                on_batch=lambda importer: reporter.report(fh.buffer.tell(), importer),
+            )
+            importer.run(read_price_list(fh, job.format))
+        finally:
+            reporter.stop()
+    return importer
+
+
+def file_digest(path):
+    digest = sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def noop_report(reason):
+    return {"Counts": {}, "Timings": {}, "NoOp": reason}
+
+
+def import_job(job, fetched):
+    """
+    Импортирует прайс задачи и возвращает отчет. Если прайс совпадает
+    с последним успешно загруженным (304 от сервера или тот же SHA-256),
+    импорт пропускается, если в задаче не указан force.
+    """
+    if job.url:
+        shop = Shop.objects.filter(url=job.url).first()
+        fetched.append(
+            fetch_price_list(
+                job.url,
+                etag=shop.etag if shop and not job.force else "",
+                last_modified=shop.last_modified if shop and not job.force else "",
+            )
+        )
+        if fetched[0].not_modified:
+            return noop_report("not_modified")
+        path = fetched[0].path
+        with open_price_list(path) as fh:
+            kind, shop_name = next(read_price_list(fh, job.format), (None, None))
+        if kind != "shop" or not shop_name:
+            raise ValueError("В прайсе не указан магазин")
+        rekey_job(job, shop_name)
+        if shop is None:
+            shop = Shop.objects.filter(name=shop_name).first()
+    else:
+        shop = Shop.objects.filter(name=job.shop_name).first()
+        path = price_list_path(job.filename, job.format)
+
+    digest = file_digest(path)
+    if shop is not None and not job.force and shop.import_digest == digest:
+        return noop_report("same_digest")
+
+    importer = import_file(job, path)
+    shop_fields = {"import_digest": digest}
+    if job.url:
+        shop_fields.update(
+            url=job.url,
+            etag=fetched[0].etag,
+            last_modified=fetched[0].last_modified,
+        )
+    Shop.objects.filter(id=importer.shop.id).update(**shop_fields)
+    return importer.report()
+
+
+def run_job(job):
+    # скачанный по ссылке прайс, удаляется после импорта
+    fetched = []
+    try:
+        report = import_job(job, fetched)
+    except JobDeferred:
+        return False
+    except Exception as error:
+        ImportJob.objects.filter(id=job.id).update(
+            state="failed", errors=str(error), finished_at=timezone.now()
+        )
+        return False
+    finally:
+        if fetched and fetched[0].path:
+            os.unlink(fetched[0].path)
+    ImportJob.objects.filter(id=job.id).update(
+        state="done", progress=100, report=report, finished_at=timezone.now()
+    )
+    return True
+
+
+def work(poll_interval=1.0, once=False):
+    """
+    Цикл воркера: берет задачи из очереди, пока они есть, затем ждет новые
+    """
+    while True:
+        job = claim_job()
+        if job is not None:
+            run_job(job)
+            continue
+        if once:
+            return
+        sleep(poll_interval)
@@ -0,0 +1,108 @@
+import csv
+import os
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from ujson import dumps as dump_json
+
+from orders.readers import PRICE_LIST_FORMATS, read_price_list
+
+PARAMETERS = ("Диагональ (дюйм)", "Разрешение (пикс)", "Встроенная память (Гб)", "Цвет")
+CATEGORIES = ({"id": 224, "name": "Смартфоны"}, {"id": 15, "name": "Аксессуары"})
+
+
+def generate_goods(count):
+    for index in range(count):
+        yield {
+            "id": index + 1,
+            "category": CATEGORIES[index % len(CATEGORIES)]["id"],
+            "model": "apple/iphone/xr",
+            "name": f"Смартфон Apple iPhone XR {index}",
+            "price": 65000 + index % 1000,
+            "price_rrc": 69990,
+            "quantity": index % 20,
+            "parameters": {
+                "Диагональ (дюйм)": "6.1",
+                "Разрешение (пикс)": "1792x828",
+                "Встроенная память (Гб)": str(64 * (1 + index % 4)),
+                "Цвет": "красный",
+            },
+        }
+
+
+def write_yaml(fh, shop, count):
+    fh.write(f"shop: {shop}\ncategories:\n")
+    for category in CATEGORIES:
+        fh.write(f"  - id: {category['id']}\n    name: {category['name']}\n")
+    fh.write("goods:\n")
+    for item in generate_goods(count):
+        fh.write(
+            f"  - id: {item['id']}\n"
+            f"    category: {item['category']}\n"
+            f"    model: {item['model']}\n"
+            f"    name: {item['name']}\n"
+            f"    price: {item['price']}\n"
+            f"    price_rrc: {item['price_rrc']}\n"
+            f"    quantity: {item['quantity']}\n"
+            f"    parameters:\n"
+        )
+        for name, value in item["parameters"].items():
+            fh.write(f'      "{name}": "{value}"\n')
+
+
+def write_csv(fh, shop, count):
+    names = {category["id"]: category["name"] for category in CATEGORIES}
+    writer = csv.writer(fh)
+    writer.writerow(
+        ["shop", "category", "category_name", "id", "model", "name", "price"]
+        + ["price_rrc", "quantity", *PARAMETERS]
+    )
+    for item in generate_goods(count):
+        writer.writerow(
+            [shop, item["category"], names[item["category"]], item["id"]]
+            + [item["model"], item["name"], item["price"], item["price_rrc"]]
+            + [item["quantity"]]
+            + [item["parameters"][name] for name in PARAMETERS]
+        )
+
+
+def write_jsonl(fh, shop, count):
+    fh.write(dump_json({"shop": shop, "categories": CATEGORIES}, ensure_ascii=False))
+    fh.write("\n")
+    for item in generate_goods(count):
+        fh.write(dump_json(item, ensure_ascii=False))
+        fh.write("\n")
+
+
+WRITERS = {"yaml": write_yaml, "csv": write_csv, "jsonl": write_jsonl}
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скорость разбора прайса в форматах yaml, csv и jsonl"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--items", type=int, default=100000, help="Количество товаров в прайсе"
+        )
+
+    def handle(self, *args, **options):
+        count = options["items"]
+        with TemporaryDirectory() as directory:
+            for format in PRICE_LIST_FORMATS:
+                path = os.path.join(directory, f"bench.{format}")
+                with open(path, "w", encoding="UTF-8", newline="") as fh:
+                    WRITERS[format](fh, "Бенчмарк", count)
+
+                started = perf_counter()
+                goods = 0
+                with open(path, encoding="UTF-8", newline="") as fh:
+                    for kind, _ in read_price_list(fh, format):
+                        goods += kind == "goods"
+                elapsed = perf_counter() - started
+
+                size = os.path.getsize(path) / 2**20
+                self.stdout.write(
+                    f"{format:>5}: {goods} товаров, {size:.1f} МБ, "
+                    f"{elapsed:.2f} с, {goods / elapsed:.0f} товаров/с"
+                )
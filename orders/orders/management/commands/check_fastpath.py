@@ -0,0 +1,135 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from orders.fastpath import order_rows, render_json
+from orders.models import Contact, Order, OrderItem, ProductInfo, Shop, User
+from orders.totals import update_totals
+from orders.views import serialized_orders
+
+# списки заказов из BasketView, OrderView и PartnerOrders
+SCOPES = {
+    "basket": lambda user: Order.objects.filter(user_id=user.id, state="basket"),
+    "orders": lambda user: Order.objects.filter(user_id=user.id).exclude(
+        state="basket"
+    ),
+    "partner_orders": lambda user: Order.objects.filter(
+        ordered_items__product_info__shop__user_id=user.id
+    ).exclude(state="basket"),
+}
+
+renderer = JSONRenderer()
+
+
+def generate_orders(count, items):
+    """
+    Покупатель с count заказами по items позиций из текущего каталога
+    и владелец магазина первой позиции
+    """
+    product_infos = list(ProductInfo.objects.order_by("id")[:items])
+    if not product_infos:
+        raise CommandError("Для генерации заказов нужен импортированный каталог")
+    buyer = User.objects.create(email="bench-buyer@example.com", username="bench-buyer")
+    owner = User.objects.create(
+        email="bench-shop@example.com", username="bench-shop", type="shop"
+    )
+    Shop.objects.filter(id=product_infos[0].shop_id).update(user=owner)
+    contact = Contact.objects.create(user=buyer, city="Москва", phone="+7000")
+    states = ("basket", "new", "confirmed", "delivered")
+    orders = Order.objects.bulk_create(
+        [
+            Order(user=buyer, state=states[index % len(states)], contact=contact)
+            for index in range(count)
+        ]
+    )
+    OrderItem.objects.bulk_create(
+        [
+            OrderItem(order=order, product_info=product_info, quantity=index + 1)
+            for order in orders
+            for index, product_info in enumerate(product_infos)
+        ]
+    )
+    update_totals([order.id for order in orders])
+    return [buyer, owner]
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет, что orders.fastpath отдает те же байты, что OrderSerializer "
+        "с JSONRenderer, и сравнивает скорость"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--generate",
+            type=int,
+            default=0,
+            help="Сгенерировать столько заказов (данные откатываются после проверки)",
+        )
+        parser.add_argument(
+            "--items", type=int, default=5, help="Позиций в сгенерированном заказе"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Повторов каждого замера"
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["generate"]:
+                users = generate_orders(options["generate"], options["items"])
+            else:
+                users = list(User.objects.filter(orders__isnull=False).distinct())
+                users += list(User.objects.filter(shop__isnull=False))
+            mismatches = self.compare(users, options["repeat"])
+            transaction.set_rollback(bool(options["generate"]))
+        if mismatches:
+            raise CommandError(f"Расхождений с OrderSerializer: {mismatches}")
+
+    def compare(self, users, repeat):
+        mismatches = 0
+        for name, scope in SCOPES.items():
+            slow = fast = 0
+            orders = 0
+            for user in users:
+                # поставщик видит суммы только по позициям своего магазина
+                shop_user_id = user.id if name == "partner_orders" else None
+                expected = renderer.render(
+                    serialized_orders(scope(user), shop_user_id=shop_user_id)
+                )
+                rows = order_rows(scope(user), shop_user_id=shop_user_id)
+                actual = render_json(rows)
+                if actual != expected:
+                    mismatches += 1
+                    self.stderr.write(
+                        f"{name}, пользователь {user.id}: вывод отличается"
+                    )
+                orders += len(rows)
+                slow += self.measure(
+                    lambda: renderer.render(
+                        serialized_orders(scope(user), shop_user_id=shop_user_id)
+                    ),
+                    repeat,
+                )
+                fast += self.measure(
+                    lambda: render_json(
+                        order_rows(scope(user), shop_user_id=shop_user_id)
+                    ),
+                    repeat,
+                )
+            speedup = slow / fast if fast else 0
+            self.stdout.write(
+                f"{name:>14}: {orders} заказов, OrderSerializer {slow * 1000:.1f} мс, "
+                f"fastpath {fast * 1000:.1f} мс, ускорение {speedup:.1f}x"
+            )
+        return mismatches
+
+    def measure(self, render, repeat):
+        best = None
+        for _ in range(repeat):
+            started = perf_counter()
+            render()
+            elapsed = perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+
+from orders.cache import bump_catalog_version
+from orders.documents import DOCUMENT_CHUNK_SIZE, refresh_documents, renderer
+from orders.models import ProductInfo, ProductInfoDocument, ProductParameter
+from orders.serializers import ProductInfoSerializer
+
+
+def serialized_documents(product_info_ids):
+    """
+    Эталон: документы, построенные ProductInfoSerializer по нормализованным
+    таблицам
+    """
+    product_infos = ProductInfo.objects.filter(
+        id__in=product_info_ids
+    ).select_related("product__category").prefetch_related(
+        Prefetch(
+            "product_parameters",
+            queryset=ProductParameter.objects.select_related("parameter").order_by(
+                "id"
+            ),
+        )
+    )
+    return {
+        product_info.id: renderer.render(
+            ProductInfoSerializer(product_info).data
+        ).decode()
+        for product_info in product_infos
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет документы каталога (ProductInfoDocument) с выводом "
+        "ProductInfoSerializer и при --repair пересобирает расхождения"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Пересобрать отсутствующие и устаревшие документы",
+        )
+
+    def handle(self, *args, **options):
+        ids = ProductInfo.objects.order_by("id").values_list("id", flat=True)
+        checked = 0
+        broken = []
+        chunk = []
+        for product_info_id in ids.iterator(chunk_size=DOCUMENT_CHUNK_SIZE):
+            chunk.append(product_info_id)
+            if len(chunk) >= DOCUMENT_CHUNK_SIZE:
+                broken.extend(self.check_chunk(chunk))
+                checked += len(chunk)
+                chunk = []
+        if chunk:
+            broken.extend(self.check_chunk(chunk))
+            checked += len(chunk)
+
+        self.stdout.write(f"Проверено товаров: {checked}, расхождений: {len(broken)}")
+        if broken and options["repair"]:
+            with transaction.atomic():
+                refresh_documents(broken)
+                bump_catalog_version(
+                    *ProductInfo.objects.filter(id__in=broken)
+                    .values_list("shop_id", flat=True)
+                    .distinct()
+                )
+            self.stdout.write(f"Пересобрано документов: {len(broken)}")
+
+    def check_chunk(self, product_info_ids):
+        expected = serialized_documents(product_info_ids)
+        stored = dict(
+            ProductInfoDocument.objects.filter(
+                product_info_id__in=product_info_ids
+            ).values_list("product_info_id", "document")
+        )
+        broken = []
+        for product_info_id, document in expected.items():
+            if product_info_id not in stored:
+                self.stdout.write(f"{product_info_id}: нет документа")
+                broken.append(product_info_id)
+            elif stored[product_info_id] != document:
+                self.stdout.write(f"{product_info_id}: документ устарел")
+                broken.append(product_info_id)
+        return broken
@@ -0,0 +1,125 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from orders.models import Category, Product, ProductInfo, Shop
+from orders.views import ProductInfoView
+
+GENERATE_BATCH_SIZE = 5000
+
+# запросы каталога, которые должны идти по индексам ProductInfo
+CASES = (
+    {"shop_id": "{shop}", "price_min": "20000", "price_max": "21000"},
+    {"shop_id": "{shop}", "price_min": "20000", "ordering": "price"},
+    {"shop_id": "{shop}", "ordering": "-price", "in_stock": "1"},
+    {"price_min": "20000", "price_max": "20100", "ordering": "price"},
+    {"ordering": "-price"},
+    {"shop_id": "{shop}"},
+)
+
+# полный проход по таблице в плане запроса
+SEQUENTIAL_SCANS = {
+    "postgresql": ("EXPLAIN ", re.compile(r"Seq Scan on orders_productinfo\b")),
+    "sqlite": ("EXPLAIN QUERY PLAN ", re.compile(r"^SCAN orders_productinfo$")),
+}
+
+
+def request_host():
+    """
+    Хост запроса для ссылок пагинации: первый из ALLOWED_HOSTS, а без них
+    DEBUG разрешает только localhost
+    """
+    for host in settings.ALLOWED_HOSTS:
+        if host != "*":
+            return host.lstrip(".")
+    return "localhost"
+
+
+def generate_catalog(items, shops):
+    """
+    items товаров, поровну в shops магазинах, с псевдослучайными ценами
+    """
+    shop_list = Shop.objects.bulk_create(
+        [Shop(name=f"Бенчмарк {index}", filename="") for index in range(shops)]
+    )
+    category = Category.objects.create(name="Бенчмарк")
+    products = Product.objects.bulk_create(
+        [
+            Product(name=f"Товар {index}", category=category)
+            for index in range(items // shops)
+        ],
+        batch_size=GENERATE_BATCH_SIZE,
+    )
+    product_infos = [
+        ProductInfo(
+            product=product,
+            shop=shop,
+            price=(index * 7919) % 100000,
+            price_rrc=100000,
+            quantity=index % 7,
+        )
+        for index, (product, shop) in enumerate(
+            (product, shop) for product in products for shop in shop_list
+        )
+    ]
+    ProductInfo.objects.bulk_create(product_infos, batch_size=GENERATE_BATCH_SIZE)
+    return shop_list[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует большой каталог (с откатом) и проверяет по EXPLAIN, "
+        "что фильтры и сортировки /products не читают ProductInfo целиком"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--items", type=int, default=200000, help="Количество товаров"
+        )
+        parser.add_argument(
+            "--shops", type=int, default=20, help="Количество магазинов"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQUENTIAL_SCANS:
+            raise CommandError(f"EXPLAIN для {connection.vendor} не поддерживается")
+        with transaction.atomic():
+            shop = generate_catalog(options["items"], options["shops"])
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+            failures = sum(self.explain(case, shop) for case in CASES)
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(f"Полный проход по ProductInfo в {failures} запросах")
+
+    def explain(self, case, shop):
+        params = {name: value.format(shop=shop.id) for name, value in case.items()}
+        factory = APIRequestFactory(SERVER_NAME=request_host())
+        request = Request(factory.get("/products", params))
+        view = ProductInfoView()
+        with CaptureQueriesContext(connection) as queries:
+            view.list_products(
+                request, view.product_query(request), view.product_ordering(request)
+            )
+
+        prefix, sequential_scan = SEQUENTIAL_SCANS[connection.vendor]
+        failures = 0
+        for query in queries:
+            if "orders_productinfo" not in query["sql"]:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + query["sql"])
+                plan = [str(row[-1]) for row in cursor.fetchall()]
+            scans = [line for line in plan if sequential_scan.search(line.strip())]
+            if scans:
+                failures += 1
+                self.stderr.write(f"{params}: {query['sql']}")
+                for line in plan:
+                    self.stderr.write(f"    {line}")
+        self.stdout.write(f"{params}: {'полный проход' if failures else 'индекс'}")
+        return failures
@@ -0,0 +1,146 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import chain
+from pathlib import Path
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# модули приложения импортируются внутри функций: процессы пула загружают
+# этот модуль до django.setup()
+
+# справочники, общие для всех файлов, обработанных процессом пула
+dimensions = None
+
+
+def init_process():
+    """
+    Настраивает Django в процессе пула и заранее загружает справочники
+    категорий и параметров
+    """
+    import django
+
+    django.setup()
+
+    from orders.importer import DimensionCache
+
+    global dimensions
+    dimensions = DimensionCache()
+    dimensions.load()
+
+
+def import_files(paths, mode, force):
+    """
+    Импортирует файлы одного магазина по очереди. Возвращает по каждому
+    файлу (путь, количество товаров, секунды, ошибка, пропущен). Файл,
+    совпадающий с последним импортом магазина, пропускается, если не указан
+    force.
+    """
+    from orders.importer import CatalogImporter
+    from orders.jobs import file_digest, open_price_list
+    from orders.models import Shop
+    from orders.readers import read_price_list
+
+    results = []
+    for path in paths:
+        started = perf_counter()
+        try:
+            digest = file_digest(path)
+            with open_price_list(path) as fh:
+                records = read_price_list(fh, Path(path).suffix[1:])
+                kind, shop_name = next(records, (None, None))
+                shop = Shop.objects.filter(name=shop_name).first()
+                if not force and shop is not None and shop.import_digest == digest:
+                    results.append((path, 0, perf_counter() - started, "", True))
+                    continue
+                importer = CatalogImporter(mode=mode, dimensions=dimensions)
+                report = importer.run(chain([(kind, shop_name)], records))
+            Shop.objects.filter(id=importer.shop.id).update(import_digest=digest)
+        except Exception as error:
+            results.append((path, 0, perf_counter() - started, str(error), False))
+        else:
+            items = report["Counts"].get("goods", 0)
+            results.append((path, items, perf_counter() - started, "", False))
+    return results
+
+
+class Command(BaseCommand):
+    help = "Параллельно импортирует все прайсы (yaml, csv, jsonl) из каталога"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Каталог с файлами прайсов")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help="Количество процессов импорта",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=("diff", "replace"),
+            default="diff",
+            help="Режим импорта",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Импортировать файлы, даже если они не менялись",
+        )
+
+    def handle(self, *args, **options):
+        from orders.jobs import open_price_list
+        from orders.readers import PRICE_LIST_FORMATS, read_price_list
+
+        directory = Path(options["directory"])
+        paths = sorted(
+            str(path)
+            for format in PRICE_LIST_FORMATS
+            for path in directory.glob(f"*.{format}")
+        )
+        if not paths:
+            raise CommandError(f"В каталоге {directory} нет файлов прайсов")
+
+        # файлы одного магазина импортируются последовательно в одном процессе,
+        # иначе параллельные импорты будут конкурировать за его каталог
+        shops = {}
+        for path in paths:
+            with open_price_list(path) as fh:
+                records = read_price_list(fh, Path(path).suffix[1:])
+                kind, shop_name = next(records, (None, None))
+            shops.setdefault(shop_name if kind == "shop" else path, []).append(path)
+
+        connections.close_all()
+        started = perf_counter()
+        results = []
+        with ProcessPoolExecutor(
+            max_workers=max(1, options["processes"]),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_process,
+        ) as pool:
+            futures = [
+                pool.submit(
+                    import_files, shop_paths, options["mode"], options["force"]
+                )
+                for shop_paths in shops.values()
+            ]
+            for future in as_completed(futures):
+                for path, items, seconds, error, skipped in future.result():
+                    results.append((path, items, seconds, error))
+                    if error:
+                        self.stderr.write(f"{path}: ошибка: {error}")
+                    elif skipped:
+                        self.stdout.write(f"{path}: не изменился, пропущен")
+                    else:
+                        self.stdout.write(
+                            f"{path}: {items} товаров за {seconds:.2f} с "
+                            f"({items / seconds if seconds else 0:.0f} товаров/с)"
+                        )
+        elapsed = perf_counter() - started
+
+        total = sum(items for _, items, _, _ in results)
+        failed = sum(1 for *_, error in results if error)
+        self.stdout.write(
+            f"Файлов: {len(results)}, с ошибками: {failed}, товаров: {total}, "
+            f"время: {elapsed:.2f} с, {total / elapsed if elapsed else 0:.0f} товаров/с"
+        )
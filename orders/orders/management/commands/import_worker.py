@@ -0,0 +1,78 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+# модули приложения импортируются внутри функций: процесс воркера загружает
+# этот модуль до django.setup()
+
+
+def run_worker(poll_interval, once):
+    """
+    Точка входа процесса воркера. Процессы запускаются методом spawn,
+    поэтому Django настраивается заново в каждом из них.
+    """
+    import django
+
+    django.setup()
+
+    from orders.jobs import work
+
+    work(poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = "Выполняет задачи импорта прайсов из очереди ImportJob"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help="Количество процессов воркера",
+        )
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=1.0,
+            help="Пауза между опросами пустой очереди, секунды",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить задачи из очереди и завершиться",
+        )
+        parser.add_argument(
+            "--requeue",
+            action="store_true",
+            help="Вернуть в очередь задачи, прерванные остановкой воркеров",
+        )
+
+    def handle(self, *args, **options):
+        from orders.jobs import requeue_running, work
+
+        if options["requeue"]:
+            self.stdout.write(f"Возвращено в очередь: {requeue_running()}")
+
+        processes = max(1, options["processes"])
+        if processes == 1:
+            work(poll_interval=options["poll"], once=options["once"])
+            return
+
+        connections.close_all()
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(
+                target=run_worker, args=(options["poll"], options["once"])
+            )
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"Запущено воркеров: {processes}")
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
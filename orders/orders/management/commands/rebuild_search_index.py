@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.search import search_index
+
+
+class Command(BaseCommand):
+    help = "Пересобирает полнотекстовый индекс товаров"
+
+    def handle(self, *args, **options):
+        index = search_index()
+        if index is None:
+            self.stderr.write("База данных не поддерживает полнотекстовый поиск")
+            return
+        with transaction.atomic():
+            index.create()
+            count = index.rebuild()
+        self.stdout.write(f"Проиндексировано товаров: {count}")
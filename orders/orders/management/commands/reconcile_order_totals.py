@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import Order
+from orders.totals import TOTALS_BATCH_SIZE, update_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает суммы заказов (Order.total_sum, Order.items_count) "
+        "по позициям и сообщает о расхождениях"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать расхождения, не исправляя их",
+        )
+
+    def handle(self, *args, **options):
+        order_ids = list(Order.objects.order_by("id").values_list("id", flat=True))
+        with transaction.atomic():
+            drift = update_totals(order_ids, TOTALS_BATCH_SIZE)
+            transaction.set_rollback(options["dry_run"])
+        for order_id, (total_sum, items_count), (expected_sum, expected_count) in drift:
+            self.stdout.write(
+                f"{order_id}: сумма {total_sum} -> {expected_sum}, "
+                f"товаров {items_count} -> {expected_count}"
+            )
+        self.stdout.write(
+            f"Проверено заказов: {len(order_ids)}, расхождений: {len(drift)}"
+            + ("" if options["dry_run"] or not drift else ", исправлено")
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.cache import bump_catalog_version
+from orders.models import Product
+from orders.offers import refresh_best_offers
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает лучшие предложения (BestOffer) всех продуктов"
+
+    def handle(self, *args, **options):
+        product_ids = Product.objects.values_list("id", flat=True)
+        with transaction.atomic():
+            count = refresh_best_offers(product_ids)
+            bump_catalog_version()
+        self.stdout.write(f"Изменено предложений: {count}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.cache import bump_catalog_version
+from orders.facets import refresh_facets
+from orders.models import Shop
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики значений параметров (ParameterFacet) магазинов"
+
+    def handle(self, *args, **options):
+        shop_ids = list(Shop.objects.values_list("id", flat=True))
+        with transaction.atomic():
+            count = sum(refresh_facets(shop_id) for shop_id in shop_ids)
+            bump_catalog_version(*shop_ids)
+        self.stdout.write(f"Пересчитано значений: {count}")
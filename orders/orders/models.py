@@ -14,6 +14,12 @@ STATUS_CHOICES = (
     ("delivered", "Доставлен"),
     ("canceled", "Отменен"),
 )
+IMPORT_STATE_CHOICES = (
+    ("queued", "В очереди"),
+    ("running", "Выполняется"),
+    ("done", "Завершен"),
+    ("failed", "Ошибка"),
+)
 USER_TYPE_CHOICES = (
     ('shop', 'Магазин'),
     ('buyer', 'Покупатель'),
@@ -100,7 +106,9 @@ class User(AbstractUser):
 
 class Shop(models.Model):
     name = models.CharField(max_length=50, verbose_name="Название", unique=True)
-    url = models.URLField(verbose_name="Ссылка", unique=True)
+    # пустая ссылка хранится как NULL, иначе второй магазин без ссылки
+    # нарушает уникальность
+    url = models.URLField(verbose_name="Ссылка", unique=True, blank=True, null=True)
     user = models.OneToOneField(
         User,
         verbose_name="Пользователь",
@@ -111,6 +119,20 @@ class Shop(models.Model):
     # state = models.BooleanField(verbose_name='статус получения заказов', default=True)
     # file will be saved to MEDIA_ROOT/data
     filename = models.CharField(max_length=50, verbose_name="Файл для загрузки товаров")
+    # валидаторы последнего прайса, скачанного по ссылке (условный GET)
+    etag = models.CharField(verbose_name="ETag прайса", max_length=200, blank=True)
+    last_modified = models.CharField(
+        verbose_name="Last-Modified прайса", max_length=50, blank=True
+    )
+    # SHA-256 последнего успешно импортированного прайса
+    import_digest = models.CharField(
+        verbose_name="Контрольная сумма прайса", max_length=64, blank=True
+    )
+    # версия каталога магазина для ключей кеша и ETag (orders.cache),
+    # увеличивается в транзакции, изменившей товары магазина
+    catalog_version = models.PositiveBigIntegerField(
+        verbose_name="Версия каталога", default=0
+    )
 
     class Meta:
         verbose_name = "Магазин"
@@ -121,6 +143,19 @@ class Shop(models.Model):
         return self.name
 
 
+class CatalogVersion(models.Model):
+    """
+    Общая версия каталога (единственная строка): увеличивается вместе
+    с версией любого магазина
+    """
+
+    version = models.PositiveBigIntegerField(verbose_name="Версия", default=0)
+
+    class Meta:
+        verbose_name = "Версия каталога"
+        verbose_name_plural = "Версия каталога"
+
+
 class Category(models.Model):
     name = models.CharField(max_length=40, verbose_name="Название", unique=True)
     shops = models.ManyToManyField(
@@ -170,9 +205,14 @@ class ProductInfo(models.Model):
         blank=True,
         on_delete=models.CASCADE,
     )
+    # доступный остаток: количество из прайса за вычетом резерва
     quantity = models.PositiveIntegerField(verbose_name="Количество")
+    # оформленные, но еще не отправленные заказы (orders.basket.reserve_stock)
+    reserved = models.PositiveIntegerField(verbose_name="В резерве", default=0)
     price = models.PositiveIntegerField(verbose_name="Цена")
     price_rrc = models.PositiveIntegerField(verbose_name="Рекомендуемая розничная цена")
+    # товар пропал из прайса поставщика, но строка сохранена для заказов
+    is_active = models.BooleanField(verbose_name="Есть в прайсе", default=True)
 
     class Meta:
         verbose_name = "Информация о продукте"
@@ -182,6 +222,14 @@ class ProductInfo(models.Model):
                 fields=["product", "shop"], name="unique_product_info"
             ),
         ]
+        # фильтр по цене и сортировка каталога магазина, продукта и всего каталога
+        indexes = [
+            models.Index(fields=["shop", "price"], name="product_info_shop_price"),
+            models.Index(
+                fields=["product", "price"], name="product_info_product_price"
+            ),
+            models.Index(fields=["price"], name="product_info_price"),
+        ]
 
 
 class Parameter(models.Model):
@@ -221,6 +269,95 @@ class ProductParameter(models.Model):
         ]
 
 
+class ProductInfoDocument(models.Model):
+    """
+    Готовый JSON товара в формате ProductInfoSerializer для списка /products.
+    Пересобирается импортом прайса и правками в админке.
+    """
+
+    product_info = models.OneToOneField(
+        ProductInfo,
+        verbose_name="Информация о продукте",
+        related_name="document",
+        primary_key=True,
+        on_delete=models.CASCADE,
+    )
+    document = models.TextField(verbose_name="JSON")
+
+    class Meta:
+        verbose_name = "Документ каталога"
+        verbose_name_plural = "Документы каталога"
+
+
+class BestOffer(models.Model):
+    """
+    Самое дешевое предложение продукта среди магазинов (активный товар
+    в наличии) и число таких предложений. Обновляется импортом прайсов
+    и правками в админке.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        verbose_name="Продукт",
+        related_name="best_offer",
+        primary_key=True,
+        on_delete=models.CASCADE,
+    )
+    product_info = models.ForeignKey(
+        ProductInfo,
+        verbose_name="Предложение",
+        related_name="+",
+        on_delete=models.CASCADE,
+    )
+    shop = models.ForeignKey(
+        Shop, verbose_name="Магазин", related_name="+", on_delete=models.CASCADE
+    )
+    price = models.PositiveIntegerField(verbose_name="Цена")
+    offers = models.PositiveIntegerField(verbose_name="Количество предложений")
+
+    class Meta:
+        verbose_name = "Лучшее предложение"
+        verbose_name_plural = "Лучшие предложения"
+
+
+class ParameterFacet(models.Model):
+    """
+    Количество активных товаров магазина в категории с данным значением
+    параметра. Таблица пересчитывается импортом прайса магазина.
+    """
+
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="parameter_facets",
+        on_delete=models.CASCADE,
+    )
+    category = models.ForeignKey(
+        Category,
+        verbose_name="Категория",
+        related_name="parameter_facets",
+        on_delete=models.CASCADE,
+    )
+    parameter = models.ForeignKey(
+        Parameter,
+        verbose_name="Параметр",
+        related_name="facets",
+        on_delete=models.CASCADE,
+    )
+    value = models.CharField(verbose_name="Значение", max_length=222)
+    count = models.PositiveIntegerField(verbose_name="Количество товаров")
+
+    class Meta:
+        verbose_name = "Значение фильтра"
+        verbose_name_plural = "Значения фильтров"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop", "category", "parameter", "value"],
+                name="unique_parameter_facet",
+            ),
+        ]
+
+
 class Contact(models.Model):
     user = models.ForeignKey(
         User,
@@ -237,6 +374,8 @@ class Contact(models.Model):
     building = models.CharField(max_length=15, verbose_name="Строение", blank=True)
     apartment = models.CharField(max_length=15, verbose_name="Квартира", blank=True)
     phone = models.CharField(max_length=20, verbose_name="Телефон", blank=True)
+    # контакт выводится в заказах: его изменение меняет ETag списка заказов
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Контакты пользователя"
@@ -255,17 +394,29 @@ class Order(models.Model):
         on_delete=models.CASCADE,
     )
     dt = models.DateTimeField(auto_now_add=True)
+    # время последнего изменения заказа или его позиций (для ETag)
+    updated_at = models.DateTimeField(auto_now=True)
     state = models.CharField(
         verbose_name="Статус", choices=STATUS_CHOICES, max_length=15
     )
     contact = models.ForeignKey(
         Contact, verbose_name="Контакт", blank=True, null=True, on_delete=models.CASCADE
     )
+    # сумма и количество товаров по позициям, меняются вместе с позициями
+    # (orders.totals), сверяются командой reconcile_order_totals
+    total_sum = models.PositiveIntegerField(verbose_name="Сумма заказа", default=0)
+    items_count = models.PositiveIntegerField(
+        verbose_name="Количество товаров", default=0
+    )
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Список заказов"
         ordering = ("-dt",)
+        indexes = [
+            # история заказов пользователя: фильтр по статусу, сортировка по дате
+            models.Index(fields=["user", "state", "dt"], name="order_user_state_dt"),
+        ]
 
     def __str__(self):
         return str(self.dt)
@@ -287,6 +438,11 @@ class OrderItem(models.Model):
         on_delete=models.CASCADE,
     )
     quantity = models.PositiveIntegerField(verbose_name="Количество")
+    # цена фиксируется при оформлении заказа; у позиций корзины - пусто,
+    # действует текущая цена товара
+    price = models.PositiveIntegerField(
+        verbose_name="Цена на момент заказа", blank=True, null=True
+    )
 
     class Meta:
         verbose_name = "Заказанная позиция"
@@ -298,6 +454,63 @@ class OrderItem(models.Model):
         ]
 
 
+class ImportJob(models.Model):
+    """
+    Задача на импорт прайса, выполняется воркером import_worker
+    """
+
+    user = models.ForeignKey(
+        User,
+        verbose_name="Пользователь",
+        related_name="import_jobs",
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    # магазин берется из заголовка прайса при постановке в очередь
+    # (для новой ссылки - после загрузки прайса), импорты одного
+    # магазина выполняются строго по очереди
+    shop_name = models.CharField(max_length=50, verbose_name="Магазин")
+    filename = models.CharField(
+        max_length=50, verbose_name="Файл для загрузки товаров", blank=True
+    )
+    url = models.URLField(verbose_name="Ссылка на прайс", blank=True)
+    format = models.CharField(
+        verbose_name="Формат прайса", max_length=10, default="yaml"
+    )
+    mode = models.CharField(verbose_name="Режим импорта", max_length=10, default="diff")
+    force = models.BooleanField(
+        verbose_name="Импорт без проверки изменений", default=False
+    )
+    state = models.CharField(
+        verbose_name="Статус",
+        choices=IMPORT_STATE_CHOICES,
+        max_length=10,
+        default="queued",
+    )
+    progress = models.PositiveSmallIntegerField(verbose_name="Прогресс, %", default=0)
+    report = models.JSONField(verbose_name="Отчет", default=dict, blank=True)
+    errors = models.TextField(verbose_name="Ошибки", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Задача импорта"
+        verbose_name_plural = "Список задач импорта"
+        ordering = ("-created_at",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop_name"],
+                condition=models.Q(state="running"),
+                name="unique_running_import",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.shop_name} {self.filename} ({self.state})"
+
+
 class ConfirmEmailToken(models.Model):
     class Meta:
         verbose_name = "Токен подтверждения Email"
@@ -0,0 +1,76 @@
+"""
+Лучшие предложения продуктов (BestOffer).
+
+Строка продукта пересчитывается по его активным товарам в наличии, когда
+у них меняются цена, количество или активность: импорт прайса передает
+продукты измененных товаров, админка - продукты отредактированных.
+Предложения продуктов читаются по индексу (product, price) ProductInfo.
+"""
+from orders.models import BestOffer, ProductInfo
+
+OFFER_CHUNK_SIZE = 1000
+
+
+def best_offers(product_ids):
+    """
+    id продукта -> (id товара, id магазина, цена, количество предложений)
+    """
+    offers = {}
+    for product_id, product_info_id, shop_id, price in (
+        ProductInfo.objects.filter(
+            product_id__in=product_ids, is_active=True, quantity__gt=0
+        )
+        .order_by("product_id", "price", "id")
+        .values_list("product_id", "id", "shop_id", "price")
+    ):
+        if product_id in offers:
+            offers[product_id][3] += 1
+        else:
+            offers[product_id] = [product_info_id, shop_id, price, 1]
+    return {product_id: tuple(offer) for product_id, offer in offers.items()}
+
+
+def refresh_best_offers(product_ids, batch_size=OFFER_CHUNK_SIZE):
+    """
+    Пересчитывает лучшие предложения продуктов и пишет только изменившиеся
+    строки; продукты без предложений удаляются из таблицы.
+    Возвращает количество измененных строк.
+    """
+    product_ids = list(product_ids)
+    changed = 0
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start : start + batch_size]
+        offers = best_offers(chunk)
+        current = {
+            product_id: offer
+            for product_id, *offer in BestOffer.objects.filter(
+                product_id__in=chunk
+            ).values_list("product_id", "product_info_id", "shop_id", "price", "offers")
+        }
+        stale = [product_id for product_id in current if product_id not in offers]
+        if stale:
+            BestOffer.objects.filter(product_id__in=stale).delete()
+        updated = [
+            BestOffer(
+                product_id=product_id,
+                product_info_id=product_info_id,
+                shop_id=shop_id,
+                price=price,
+                offers=count,
+            )
+            for product_id, (product_info_id, shop_id, price, count) in offers.items()
+            if tuple(current.get(product_id, ())) != (
+                product_info_id,
+                shop_id,
+                price,
+                count,
+            )
+        ]
+        BestOffer.objects.bulk_create(
+            updated,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=["product_info", "shop", "price", "offers"],
+        )
+        changed += len(stale) + len(updated)
+    return changed
@@ -0,0 +1,48 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class ProductInfoPagination(CursorPagination):
+    """
+    Курсорная пагинация каталога по первичному ключу: следующая страница
+    выбирается условием id > курсор, поэтому дальние страницы стоят столько же,
+    сколько первая. Размер страницы по умолчанию - PAGE_SIZE из REST_FRAMEWORK.
+    ProductInfoView подменяет ordering при сортировке по цене, количеству
+    или названию; курсор тогда строится по значению этого поля.
+    """
+
+    ordering = "id"
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class ProductSearchPagination(PageNumberPagination):
+    """
+    Постраничный вывод результатов поиска. Порядок задается релевантностью,
+    а не столбцом таблицы, поэтому курсор по id здесь не подходит; число
+    результатов ограничено SEARCH_LIMIT, и номер страницы обходится дешево.
+    """
+
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class BestOfferPagination(CursorPagination):
+    """
+    Курсорная пагинация лучших предложений по id продукта (первичный ключ
+    BestOffer)
+    """
+
+    ordering = "product_id"
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class OrderHistoryPagination(CursorPagination):
+    """
+    Курсорная пагинация истории заказов от новых к старым; id различает
+    заказы с одинаковым временем
+    """
+
+    ordering = ("-dt", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 500
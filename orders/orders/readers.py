@@ -0,0 +1,211 @@
+"""
+Потоковое чтение прайс-листов поставщиков.
+
+Читатели всех форматов отдают одинаковые записи: ("shop", название),
+("category", {"id", "name"}) и ("goods", товар в схеме data/shop1.yaml).
+"""
+import csv
+
+from ujson import loads as load_json
+from yaml import (
+    MappingEndEvent,
+    MappingStartEvent,
+    ScalarEvent,
+    ScalarNode,
+    SequenceEndEvent,
+    SequenceStartEvent,
+    StreamEndEvent,
+)
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+class PriceListReader:
+    """
+    Базовый класс читателя прайса
+    """
+
+    format = None
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self):
+        raise NotImplementedError
+
+
+class YamlReader(PriceListReader):
+    """
+    Разбирает YAML-прайс по событиям парсера и отдает записи по одной.
+    В памяти одновременно находится только текущий товар, поэтому
+    расход памяти не зависит от размера файла.
+    """
+
+    format = "yaml"
+
+    def records(self):
+        loader = SafeLoader(self.stream)
+        try:
+            loader.get_event()
+            if loader.check_event(StreamEndEvent):
+                return
+            loader.get_event()
+            if not isinstance(loader.get_event(), MappingStartEvent):
+                raise ValueError("Неверный формат прайса")
+            while not loader.check_event(MappingEndEvent):
+                key = _construct(loader, loader.get_event())
+                event = loader.get_event()
+                if key in ("categories", "goods") and isinstance(
+                    event, SequenceStartEvent
+                ):
+                    kind = "category" if key == "categories" else "goods"
+                    while not loader.check_event(SequenceEndEvent):
+                        yield kind, _construct(loader, loader.get_event())
+                    loader.get_event()
+                elif key == "shop":
+                    yield "shop", _construct(loader, event)
+                else:
+                    _construct(loader, event)
+        finally:
+            loader.dispose()
+
+
+class CsvReader(PriceListReader):
+    """
+    CSV с заголовком: shop, category, category_name, id, model, name, price,
+    price_rrc, quantity; остальные колонки - параметры товара,
+    пустые значения параметров пропускаются
+    """
+
+    format = "csv"
+    columns = (
+        "shop",
+        "category",
+        "category_name",
+        "id",
+        "model",
+        "name",
+        "price",
+        "price_rrc",
+        "quantity",
+    )
+    integer_columns = ("category", "id", "price", "price_rrc", "quantity")
+
+    def records(self):
+        rows = csv.reader(self.stream)
+        header = next(rows, None)
+        if header is None:
+            return
+        if tuple(header[: len(self.columns)]) != self.columns:
+            raise ValueError("Неверный заголовок CSV-прайса")
+        parameters = header[len(self.columns) :]
+        shop = None
+        categories = set()
+        for row in rows:
+            if not row:
+                continue
+            item = dict(zip(self.columns, row))
+            if shop is None:
+                shop = item["shop"]
+                yield "shop", shop
+            elif item["shop"] != shop:
+                raise ValueError("В CSV-прайсе указано несколько магазинов")
+            try:
+                for column in self.integer_columns:
+                    item[column] = int(item[column])
+            except ValueError:
+                raise ValueError(f"Неверное число в строке {rows.line_num} CSV-прайса")
+            if item["category"] not in categories:
+                categories.add(item["category"])
+                yield "category", {
+                    "id": item["category"],
+                    "name": item["category_name"],
+                }
+            yield "goods", {
+                "id": item["id"],
+                "category": item["category"],
+                "model": item["model"],
+                "name": item["name"],
+                "price": item["price"],
+                "price_rrc": item["price_rrc"],
+                "quantity": item["quantity"],
+                "parameters": {
+                    name: value
+                    for name, value in zip(parameters, row[len(self.columns) :])
+                    if value != ""
+                },
+            }
+
+
+class JsonLinesReader(PriceListReader):
+    """
+    JSON Lines: строка с ключом "shop" - заголовок магазина со списком
+    "categories", каждая следующая строка - товар
+    """
+
+    format = "jsonl"
+
+    def records(self):
+        for line in self.stream:
+            if not line.strip():
+                continue
+            record = load_json(line)
+            if "shop" in record:
+                yield "shop", record["shop"]
+                for category in record.get("categories", []):
+                    yield "category", category
+            else:
+                yield "goods", record
+
+
+READERS = {
+    reader.format: reader for reader in (YamlReader, CsvReader, JsonLinesReader)
+}
+PRICE_LIST_FORMATS = tuple(READERS)
+
+
+def read_price_list(stream, format="yaml"):
+    """
+    Возвращает поток записей прайса в указанном формате
+    """
+    if format not in READERS:
+        raise ValueError(f"Неизвестный формат прайса: {format}")
+    return READERS[format](stream).records()
+
+
+def _construct(loader, event):
+    """
+    Собирает значение узла из событий парсера, начиная с event
+    """
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        node = ScalarNode(
+            tag, event.value, event.start_mark, event.end_mark, event.style
+        )
+        # скалярные конструкторы не рекурсивны, вызываем их напрямую
+        constructor = loader.yaml_constructors.get(tag)
+        if constructor is None:
+            return loader.construct_document(node)
+        return constructor(loader, node)
+    if isinstance(event, SequenceStartEvent):
+        items = []
+        while not loader.check_event(SequenceEndEvent):
+            items.append(_construct(loader, loader.get_event()))
+        loader.get_event()
+        return items
+    if isinstance(event, MappingStartEvent):
+        mapping = {}
+        while not loader.check_event(MappingEndEvent):
+            key = _construct(loader, loader.get_event())
+            mapping[key] = _construct(loader, loader.get_event())
+        loader.get_event()
+        return mapping
+    raise ValueError("Неверный формат прайса")
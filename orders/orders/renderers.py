@@ -0,0 +1,43 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import json
+
+
+class Documents(list):
+    """
+    Список уже отрендеренных JSON-документов (bytes) в ответе view
+    """
+
+
+class CatalogJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, который вставляет готовые документы (Documents) в ответ
+    как есть, без разбора и повторной сериализации. Результат совпадает
+    побайтно с обычным JSONRenderer. Для ответа с отступами (browsable API,
+    indent=...) документы разбираются и рендерятся обычным способом.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and any(
+            isinstance(value, Documents) for value in data.values()
+        ):
+            if self.get_indent(accepted_media_type, renderer_context or {}) is None:
+                return self.render_documents(data)
+            data = {
+                key: [json.loads(document) for document in value]
+                if isinstance(value, Documents)
+                else value
+                for key, value in data.items()
+            }
+        return super().render(data, accepted_media_type, renderer_context)
+
+    def render_documents(self, data):
+        parts = []
+        for key, value in data.items():
+            if isinstance(value, Documents):
+                rendered = b"[" + b",".join(value) + b"]"
+            elif value is None:
+                rendered = b"null"
+            else:
+                rendered = super().render(value)
+            parts.append(super().render(key) + b":" + rendered)
+        return b"{" + b",".join(parts) + b"}"
@@ -0,0 +1,236 @@
+"""
+Полнотекстовый поиск товаров.
+
+Индекс хранится в отдельной таблице orders_product_search: одна строка на
+ProductInfo с текстом из названия продукта и значений параметров. В Postgres
+по тексту строятся tsvector с GIN-индексом и триграммный индекс pg_trgm
+(опечатки, части слов), в SQLite - виртуальная таблица FTS5. Таблица
+создается после migrate, импорт прайса обновляет строки измененных товаров,
+команда rebuild_search_index пересобирает индекс целиком.
+"""
+import re
+
+from django.db import connection
+
+from orders.models import ProductInfo, ProductParameter
+
+SEARCH_TABLE = "orders_product_search"
+# сколько лучших совпадений (уже после фильтров) поиск отдает на пагинацию
+SEARCH_LIMIT = 1000
+INDEX_CHUNK_SIZE = 1000
+
+WORD_RE = re.compile(r"\w+")
+
+
+def build_documents(product_info_ids):
+    """
+    Текст для индекса: название продукта и значения параметров
+    """
+    documents = {
+        product_info_id: [name]
+        for product_info_id, name in ProductInfo.objects.filter(
+            id__in=product_info_ids
+        ).values_list("id", "product__name")
+    }
+    for product_info_id, value in ProductParameter.objects.filter(
+        product_info_id__in=documents
+    ).values_list("product_info_id", "value"):
+        documents[product_info_id].append(value)
+    return {
+        product_info_id: " ".join(parts) for product_info_id, parts in documents.items()
+    }
+
+
+def candidate_condition(column, candidates):
+    """
+    SQL-условие "column IN (SELECT id ...)" по queryset ProductInfo с
+    фильтрами каталога и его параметры; без candidates условия нет
+    """
+    if candidates is None:
+        return "", []
+    sql, params = candidates.values("id").query.sql_with_params()
+    return f" AND {column} IN ({sql})", list(params)
+
+
+def chunks(ids, size=INDEX_CHUNK_SIZE):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start : start + size]
+
+
+class SearchIndex:
+    """
+    Базовый класс индекса. Запись идет через текущее соединение, поэтому
+    изменения индекса фиксируются вместе с транзакцией импорта.
+    """
+
+    def create(self):
+        raise NotImplementedError
+
+    def delete(self, product_info_ids):
+        raise NotImplementedError
+
+    def insert(self, documents):
+        raise NotImplementedError
+
+    def search(self, query, candidates=None, limit=SEARCH_LIMIT):
+        """
+        Возвращает id товаров от самых релевантных к менее релевантным.
+        candidates - queryset ProductInfo с фильтрами каталога: фильтры
+        применяются в том же запросе до limit, поэтому подходящие товары
+        не теряются за лучшими совпадениями других магазинов и категорий.
+        """
+        raise NotImplementedError
+
+    def update(self, product_info_ids):
+        """
+        Переиндексирует товары; строки без ProductInfo удаляются из индекса
+        """
+        for ids in chunks(product_info_ids):
+            self.delete(ids)
+            self.insert(build_documents(ids))
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        ids = ProductInfo.objects.filter(is_active=True).values_list("id", flat=True)
+        count = 0
+        for chunk in chunks(ids.order_by("id").iterator(chunk_size=INDEX_CHUNK_SIZE)):
+            documents = build_documents(chunk)
+            self.insert(documents)
+            count += len(documents)
+        return count
+
+
+class PostgresSearchIndex(SearchIndex):
+    config = "russian"
+
+    def create(self):
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+                " product_info_id bigint PRIMARY KEY"
+                " REFERENCES orders_productinfo (id) ON DELETE CASCADE"
+                " DEFERRABLE INITIALLY DEFERRED,"
+                " document text NOT NULL,"
+                f" vector tsvector GENERATED ALWAYS AS"
+                f" (to_tsvector('{self.config}', document)) STORED)"
+            )
+            # id ProductInfo - bigint (BigAutoField); таблица, созданная
+            # раньше с integer, переводится на bigint, для bigint это no-op
+            cursor.execute(
+                f"ALTER TABLE {SEARCH_TABLE}"
+                " ALTER COLUMN product_info_id TYPE bigint"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_vector"
+                f" ON {SEARCH_TABLE} USING gin (vector)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_trgm"
+                f" ON {SEARCH_TABLE} USING gin (document gin_trgm_ops)"
+            )
+
+    def delete(self, product_info_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE product_info_id = ANY(%s)",
+                [list(product_info_ids)],
+            )
+
+    def insert(self, documents):
+        if not documents:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (product_info_id, document)"
+                " VALUES (%s, %s) ON CONFLICT (product_info_id)"
+                " DO UPDATE SET document = EXCLUDED.document",
+                list(documents.items()),
+            )
+
+    def search(self, query, candidates=None, limit=SEARCH_LIMIT):
+        # слова целиком ищет tsvector, опечатки и части слов - триграммы
+        condition, params = candidate_condition("product_info_id", candidates)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT product_info_id FROM {SEARCH_TABLE},"
+                f" plainto_tsquery('{self.config}', %s) AS query"
+                f" WHERE (vector @@ query OR %s <%% document){condition}"
+                " ORDER BY ts_rank(vector, query) + word_similarity(%s, document)"
+                " DESC, product_info_id LIMIT %s",
+                [query, query, *params, query, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SqliteSearchIndex(SearchIndex):
+    """
+    FTS5 для локального запуска и проверок на SQLite. rowid строки индекса
+    совпадает с id ProductInfo.
+    """
+
+    def create(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}"
+                " USING fts5(document, tokenize='unicode61')"
+            )
+
+    def delete(self, product_info_ids):
+        product_info_ids = list(product_info_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN"
+                f" ({', '.join(['%s'] * len(product_info_ids))})",
+                product_info_ids,
+            )
+
+    def insert(self, documents):
+        if not documents:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, document) VALUES (%s, %s)",
+                list(documents.items()),
+            )
+
+    def search(self, query, candidates=None, limit=SEARCH_LIMIT):
+        # каждое слово запроса ищется как префикс, синтаксис FTS5 экранируется
+        words = WORD_RE.findall(query)
+        if not words:
+            return []
+        match = " ".join(f'"{word}"*' for word in words)
+        condition, params = candidate_condition("rowid", candidates)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+                f"{condition} ORDER BY rank, rowid LIMIT %s",
+                [match, *params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+SEARCH_BACKENDS = {
+    "postgresql": PostgresSearchIndex,
+    "sqlite": SqliteSearchIndex,
+}
+
+
+def search_index():
+    """
+    Индекс для текущей базы или None, если база поиск не поддерживает
+    """
+    backend = SEARCH_BACKENDS.get(connection.vendor)
+    return backend() if backend is not None else None
+
+
+def create_search_index(**kwargs):
+    """
+    Обработчик post_migrate: таблица индекса не описывается моделью,
+    поэтому создается отдельно
+    """
+    index = search_index()
+    if index is not None:
+        index.create()
@@ -89,6 +89,17 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# версии каталога, из которых строятся ключи кеша и ETag, хранятся в базе,
+# поэтому и локальный кеш процесса не отдает ответы, устаревшие после импорта
+# в воркере; общий бэкенд (Redis, Memcached) лишь делит записи между процессами
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -128,6 +139,9 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MEDIA_ROOT = "D:/Diplom/python-final-diplom/data/"
+# списки заказов через orders.fastpath (values_list + ujson) вместо
+# OrderSerializer; вывод тот же, проверка - manage.py check_fastpath
+FAST_SERIALIZATION = False
 AUTH_USER_MODEL = 'orders.User'
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -0,0 +1,774 @@
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from threading import Thread
+from time import sleep
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from orders.basket import BasketError, add_to_basket, checkout, release_stock
+from orders.documents import refresh_documents
+from orders.facets import refresh_facets
+from orders.fastpath import order_rows
+from orders.importer import CatalogImporter
+from orders.jobs import JobDeferred, claim_job, enqueue_import, rekey_job, run_job
+from orders.models import (
+    Category,
+    Contact,
+    ImportJob,
+    Order,
+    OrderItem,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+    User,
+)
+from orders.search import search_index
+from orders.totals import update_totals
+from orders.views import serialized_orders
+
+
+class OrderHistoryFilterTest(TestCase):
+    """
+    Фильтры dt_from и dt_to истории заказов (OrderView.get)
+    """
+
+    def setUp(self):
+        user = User.objects.create(email="buyer@example.com", username="buyer")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}"
+        )
+        contact = Contact.objects.create(user=user, city="Москва", phone="+7000")
+        self.orders = {}
+        for name, dt in (
+            ("before", datetime(2026, 10, 17, 23, 59, tzinfo=timezone.utc)),
+            ("morning", datetime(2026, 10, 18, 3, 36, tzinfo=timezone.utc)),
+            ("evening", datetime(2026, 10, 18, 23, 59, tzinfo=timezone.utc)),
+            ("after", datetime(2026, 10, 19, 0, 0, tzinfo=timezone.utc)),
+        ):
+            order = Order.objects.create(user=user, state="new", contact=contact)
+            Order.objects.filter(id=order.id).update(dt=dt)
+            self.orders[name] = order.id
+
+    def history(self, **params):
+        response = self.client.get("/order", params)
+        self.assertEqual(response.status_code, 200)
+        return {order["id"] for order in response.json()["results"]}
+
+    def expected(self, *names):
+        return {self.orders[name] for name in names}
+
+    def test_date_to_includes_whole_day(self):
+        self.assertEqual(
+            self.history(dt_to="2026-10-18"),
+            self.expected("before", "morning", "evening"),
+        )
+
+    def test_date_range(self):
+        self.assertEqual(
+            self.history(dt_from="2026-10-18", dt_to="2026-10-18"),
+            self.expected("morning", "evening"),
+        )
+
+    def test_datetime_to_is_inclusive(self):
+        self.assertEqual(
+            self.history(dt_from="2026-10-18", dt_to="2026-10-18T03:36:00Z"),
+            self.expected("morning"),
+        )
+
+    def test_invalid_date(self):
+        for params in ({"dt_to": "2026-02-30"}, {"dt_from": "вчера"}):
+            self.assertEqual(self.client.get("/order", params).status_code, 400)
+
+
+class PartnerOrderTotalsTest(TestCase):
+    """
+    Поставщик видит сумму заказа только по позициям своего магазина
+    """
+
+    def setUp(self):
+        buyer = User.objects.create(email="buyer@example.com", username="buyer")
+        self.owner = User.objects.create(
+            email="shop@example.com", username="shop", type="shop"
+        )
+        category = Category.objects.create(name="Смартфоны")
+        product = Product.objects.create(name="Телефон", category=category)
+        own = Shop.objects.create(name="Свой", filename="own.yaml", user=self.owner)
+        other = Shop.objects.create(name="Чужой", filename="other.yaml")
+        self.order = Order.objects.create(user=buyer, state="new")
+        for shop, quantity, price in ((own, 2, 100), (other, 3, 1000)):
+            OrderItem.objects.create(
+                order=self.order,
+                quantity=quantity,
+                price=price,
+                product_info=ProductInfo.objects.create(
+                    product=product,
+                    shop=shop,
+                    quantity=10,
+                    price=price,
+                    price_rrc=price,
+                ),
+            )
+        update_totals([self.order.id])
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.owner).key}"
+        )
+
+    def test_partner_orders(self):
+        response = self.client.get("/partner/orders")
+        self.assertEqual(response.status_code, 200)
+        order = response.json()[0]
+        self.assertEqual((order["total_sum"], order["items_count"]), (200, 2))
+        self.assertEqual(
+            Order.objects.filter(id=self.order.id)
+            .values_list("total_sum", "items_count")
+            .get(),
+            (3200, 5),
+        )
+
+    def test_fastpath_matches_serializer(self):
+        orders = Order.objects.filter(id=self.order.id)
+        for fields in (None, ("id", "total_sum", "items_count")):
+            self.assertEqual(
+                order_rows(orders, fields, self.owner.id),
+                serialized_orders(orders, fields, self.owner.id),
+            )
+
+
+class FastSerializationTest(TestCase):
+    """
+    Ответы /basket и /order с FAST_SERIALIZATION побайтно совпадают
+    с ответами сериализатора
+    """
+
+    def setUp(self):
+        user = User.objects.create(email="buyer@example.com", username="buyer")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}"
+        )
+        contact = Contact.objects.create(
+            user=user, city="Москва", street="Ленина / 1", phone="+7000"
+        )
+        category = Category.objects.create(name="Смартфоны")
+        shop = Shop.objects.create(name="Связной", filename="shop1.yaml")
+        parameter = Parameter.objects.create(name="Цвет")
+        for state in ("basket", "new", "delivered"):
+            order = Order.objects.create(user=user, state=state, contact=contact)
+            for index in range(2):
+                product_info = ProductInfo.objects.create(
+                    product=Product.objects.create(
+                        name=f"Смартфон {state}/{index}\u2028", category=category
+                    ),
+                    shop=shop,
+                    quantity=10,
+                    price=1000 + index,
+                    price_rrc=1100 + index,
+                )
+                ProductParameter.objects.create(
+                    product_info=product_info, parameter=parameter, value="черный"
+                )
+                OrderItem.objects.create(
+                    order=order, product_info=product_info, quantity=index + 1
+                )
+            update_totals([order.id])
+
+    def responses(self, url, params=None):
+        contents = []
+        for fast in (True, False):
+            with override_settings(FAST_SERIALIZATION=fast):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            contents.append(response.content)
+        return contents
+
+    def test_basket(self):
+        fast, serialized = self.responses("/basket")
+        self.assertEqual(fast, serialized)
+
+    def test_orders(self):
+        for params in (None, {"summary": "1"}, {"fields": "id,state,total_sum"}):
+            fast, serialized = self.responses("/order", params)
+            self.assertEqual(fast, serialized)
+
+
+class ProductSearchFilterTest(TestCase):
+    """
+    Фильтры каталога применяются в запросе к индексу поиска до лимита
+    """
+
+    def setUp(self):
+        category = Category.objects.create(name="Смартфоны")
+        self.shops = [
+            Shop.objects.create(name=name, filename=f"{name}.yaml")
+            for name in ("first", "second")
+        ]
+        ids = []
+        for index in range(6):
+            product = Product.objects.create(
+                name=f"Смартфон {index}", category=category
+            )
+            ids.append(
+                ProductInfo.objects.create(
+                    product=product,
+                    shop=self.shops[index // 5],
+                    quantity=10,
+                    price=1000 + index,
+                    price_rrc=1000 + index,
+                ).id
+            )
+        self.last = ids[-1]
+        search_index().update(ids)
+
+    def test_filter_before_limit(self):
+        # совпадения первого магазина ранжируются выше, но лимит считается
+        # только по товарам второго
+        self.assertEqual(
+            search_index().search(
+                "смартфон",
+                ProductInfo.objects.filter(shop_id=self.shops[1].id),
+                limit=1,
+            ),
+            [self.last],
+        )
+
+    def test_products_count(self):
+        response = self.client.get(
+            "/products", {"q": "смартфон", "shop_id": self.shops[1].id}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 1)
+        self.assertEqual(response.json()["results"][0]["id"], self.last)
+
+    def test_invalid_filters(self):
+        for name in ("id", "shop_id", "category_id", "price_min", "price_max"):
+            response = self.client.get("/products", {name: "x"})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["Errors"], f"Неверное значение {name}: x")
+
+
+class ProductFacetsTest(TestCase):
+    """
+    Счетчики facets=1 считаются по товарам с учетом всех фильтров запроса
+    """
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Смартфоны")
+        self.shop = Shop.objects.create(name="first", filename="first.yaml")
+        color = Parameter.objects.create(name="Цвет")
+        for index, (value, price) in enumerate(
+            (("черный", 1000), ("черный", 3000), ("белый", 2000))
+        ):
+            product_info = ProductInfo.objects.create(
+                product=Product.objects.create(
+                    name=f"Смартфон {index}", category=category
+                ),
+                shop=self.shop,
+                quantity=index,
+                price=price,
+                price_rrc=price,
+            )
+            ProductParameter.objects.create(
+                product_info=product_info, parameter=color, value=value
+            )
+        refresh_facets(self.shop.id)
+
+    def facets(self, **params):
+        response = self.client.get(
+            "/products", {"facets": "1", "shop_id": self.shop.id, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["facets"]
+
+    def test_shop(self):
+        self.assertEqual(self.facets(), {"Цвет": {"черный": 2, "белый": 1}})
+
+    def test_filters(self):
+        for params, expected in (
+            ({"param[Цвет]": "черный"}, {"черный": 2}),
+            ({"price_max": "2000"}, {"черный": 1, "белый": 1}),
+            ({"in_stock": "1"}, {"черный": 1, "белый": 1}),
+        ):
+            self.assertEqual(self.facets(**params), {"Цвет": expected})
+
+
+class ProductCursorPaginationTest(TestCase):
+    """
+    Каждая страница каталога читается постоянным числом запросов
+    и не длиннее page_size
+    """
+
+    PAGE_SIZE = 3
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Смартфоны")
+        shop = Shop.objects.create(name="first", filename="first.yaml")
+        self.ids = []
+        for index in range(8):
+            product = Product.objects.create(
+                name=f"Смартфон {index}", category=category
+            )
+            self.ids.append(
+                ProductInfo.objects.create(
+                    product=product,
+                    shop=shop,
+                    quantity=10,
+                    price=1000 - index % 3,
+                    price_rrc=1000,
+                ).id
+            )
+        refresh_documents(self.ids)
+
+    def walk(self, **params):
+        """
+        id товаров всех страниц по ссылкам next
+        """
+        ids = []
+        url = "/products"
+        params["page_size"] = self.PAGE_SIZE
+        while url is not None:
+            # версия каталога (одна на ETag и ключ кеша), затем страница
+            with self.assertNumQueries(2):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data["results"]), self.PAGE_SIZE)
+            ids += [product_info["id"] for product_info in data["results"]]
+            url, params = data["next"], None
+        return ids
+
+    def test_pages(self):
+        self.assertEqual(self.walk(), self.ids)
+
+    def test_pages_by_price(self):
+        self.assertEqual(sorted(self.walk(ordering="price")), sorted(self.ids))
+
+    def test_etag_per_renderer(self):
+        etags = []
+        for accept in ("application/json", "text/html"):
+            response = self.client.get("/products", HTTP_ACCEPT=accept)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("Accept", response["Vary"])
+            etags.append(response["ETag"])
+        self.assertNotEqual(*etags)
+        # актуальный ETag: только версия каталога, страница не читается
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/products", HTTP_ACCEPT="application/json", HTTP_IF_NONE_MATCH=etags[0]
+            )
+        self.assertEqual(response.status_code, 304)
+
+
+class CatalogQueryPlanTest(TestCase):
+    """
+    Фильтры и сортировки /products идут по индексам ProductInfo
+    (команда explain_catalog на небольшом каталоге)
+    """
+
+    def test_explain_catalog(self):
+        output = StringIO()
+        call_command("explain_catalog", items=20000, shops=20, stdout=output)
+        self.assertNotIn("полный проход", output.getvalue())
+
+
+class BestOfferQueryTest(TestCase):
+    """
+    Неверные фильтры /products/best-offers отклоняются с кодом 400
+    """
+
+    def test_invalid_filters(self):
+        for params in ({"category_id": "x"}, {"product_id": "1,x"}):
+            response = self.client.get("/products/best-offers", params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_category(self):
+        response = self.client.get("/products/best-offers", {"category_id": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
+
+
+class StockReservationTest(TestCase):
+    """
+    Импорт прайса не возвращает в остаток товар оформленных заказов
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(email="buyer@example.com", username="buyer")
+        self.contact = Contact.objects.create(
+            user=self.user, city="Москва", phone="+7000"
+        )
+        self.import_price_list(10)
+        self.product_info = ProductInfo.objects.get()
+
+    def import_price_list(self, quantity):
+        CatalogImporter().run(
+            [
+                ("shop", "Склад"),
+                ("category", {"id": 1, "name": "Смартфоны"}),
+                (
+                    "goods",
+                    {
+                        "id": 1,
+                        "category": 1,
+                        "model": "phone",
+                        "name": "Смартфон",
+                        "price": 1000,
+                        "price_rrc": 1200,
+                        "quantity": quantity,
+                        "parameters": {},
+                    },
+                ),
+            ]
+        )
+
+    def checkout(self, quantity):
+        add_to_basket(
+            self.user.id, [{"product_info": self.product_info.id, "quantity": quantity}]
+        )
+        order = Order.objects.get(user=self.user, state="basket")
+        self.assertTrue(checkout(self.user.id, order.id, self.contact.id))
+        return order.id
+
+    def stock(self):
+        return ProductInfo.objects.values_list("quantity", "reserved").get()
+
+    def test_import_keeps_reservation(self):
+        self.checkout(3)
+        self.assertEqual(self.stock(), (7, 3))
+        # поставщик еще не отправил заказ: в прайсе прежнее количество
+        self.import_price_list(10)
+        self.assertEqual(self.stock(), (7, 3))
+        self.import_price_list(12)
+        self.assertEqual(self.stock(), (9, 3))
+
+    def test_release_sent_order(self):
+        order_id = self.checkout(3)
+        release_stock(order_id)
+        self.assertEqual(self.stock(), (7, 0))
+        # отправленный заказ поставщик вычел из прайса
+        self.import_price_list(7)
+        self.assertEqual(self.stock(), (7, 0))
+
+    def test_release_canceled_order(self):
+        release_stock(self.checkout(3), restock=True)
+        self.assertEqual(self.stock(), (10, 0))
+
+
+# повторы транзакции, прерванной базой (SQLite: "database table is locked")
+CHECKOUT_RETRIES = 50
+CHECKOUT_RETRY_DELAY = 0.01
+
+
+def checkout_worker(basket):
+    """
+    Оформление корзины (id пользователя, id корзины, id контакта) в потоке:
+    "ok", "out_of_stock" или "database_error", если повторы не помогли
+    """
+    try:
+        for attempt in range(CHECKOUT_RETRIES):
+            try:
+                return "ok" if checkout(*basket) else "no_basket"
+            except BasketError:
+                return "out_of_stock"
+            except DatabaseError:
+                sleep(CHECKOUT_RETRY_DELAY * (attempt + 1))
+        return "database_error"
+    finally:
+        connection.close()
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    """
+    Параллельные оформления корзин за одни и те же товары не продают
+    больше остатка, а резерв равен проданному количеству
+    """
+
+    BUYERS = 40
+    THREADS = 8
+    STOCK = 30
+    QUANTITY = 3
+
+    def setUp(self):
+        shop = Shop.objects.create(name="Склад", filename="")
+        category = Category.objects.create(name="Смартфоны")
+        self.product_infos = [
+            ProductInfo.objects.create(
+                product=Product.objects.create(
+                    name=f"Товар {index}", category=category
+                ),
+                shop=shop,
+                price=100,
+                price_rrc=100,
+                quantity=self.STOCK,
+            )
+            for index in range(2)
+        ]
+        users = User.objects.bulk_create(
+            [
+                User(email=f"buyer-{index}@example.com", username=f"buyer-{index}")
+                for index in range(self.BUYERS)
+            ]
+        )
+        contacts = Contact.objects.bulk_create(
+            [Contact(user=user, city="Москва", phone="+7000") for user in users]
+        )
+        orders = Order.objects.bulk_create(
+            [Order(user=user, state="basket") for user in users]
+        )
+        # половина корзин содержит товары в обратном порядке
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order, product_info=product_info, quantity=self.QUANTITY
+                )
+                for index, order in enumerate(orders)
+                for product_info in self.product_infos[:: 1 if index % 2 else -1]
+            ]
+        )
+        self.baskets = [
+            (user.id, order.id, contact.id)
+            for user, order, contact in zip(users, orders, contacts)
+        ]
+
+    def test_no_oversell(self):
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            results = list(executor.map(checkout_worker, self.baskets))
+        self.assertNotIn("database_error", results)
+        self.assertEqual(results.count("ok"), self.STOCK // self.QUANTITY)
+
+        sold = dict(
+            OrderItem.objects.filter(order__state="new")
+            .values("product_info_id")
+            .annotate(sold=Sum("quantity"))
+            .values_list("product_info_id", "sold")
+        )
+        for product_info in self.product_infos:
+            product_info.refresh_from_db()
+            self.assertEqual(product_info.reserved, sold[product_info.id])
+            self.assertEqual(
+                product_info.quantity + sold[product_info.id], self.STOCK
+            )
+
+
+# размер сгенерированного прайса; полный прогон - IMPORT_MEMORY_ITEMS=1000000
+IMPORT_MEMORY_ITEMS = int(os.environ.get("IMPORT_MEMORY_ITEMS", 10000))
+# потолок прироста пикового RSS за импорт в мегабайтах, от размера прайса
+# не зависит
+IMPORT_MEMORY_LIMIT = 48
+
+# настройки процесса импорта: своя база SQLite в файле. Без DEBUG, иначе
+# соединение копит текст запросов
+IMPORT_SETTINGS = """
+from orders.settings import *
+
+DEBUG = False
+DATABASES = {{"default": {{"ENGINE": "django.db.backends.sqlite3", "NAME": {name!r}}}}}
+"""
+
+# импорт прайса дважды: новые товары и сверка с каталогом магазина.
+# Выводит RSS до импорта и пиковый RSS в килобайтах. ru_maxrss в Linux
+# сохраняет пик родителя через fork и exec, поэтому там читается VmHWM
+# процесса; ru_maxrss в macOS - в байтах
+IMPORT_SCRIPT = """
+import resource
+import sys
+
+import django
+
+django.setup()
+
+from django.core.management import call_command
+
+from orders.importer import CatalogImporter
+from orders.readers import read_price_list
+
+
+def rss(name):
+    try:
+        with open("/proc/self/status") as status:
+            return next(int(line.split()[1]) for line in status if line[:6] == name)
+    except OSError:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss // 1024 if sys.platform == "darwin" else rss
+
+
+call_command("migrate", run_syncdb=True, verbosity=0)
+baseline = rss("VmRSS:")
+for _ in range(2):
+    with open(sys.argv[1], encoding="utf-8") as stream:
+        CatalogImporter().run(read_price_list(stream))
+print(baseline, rss("VmHWM:"))
+"""
+
+
+def write_price_list(path, items):
+    """
+    YAML-прайс в схеме data/shop1.yaml с items товарами
+    """
+    with open(path, "w", encoding="utf-8") as stream:
+        stream.write("shop: Генератор\ncategories:\n  - id: 1\n    name: Смартфоны\n")
+        stream.write("goods:\n")
+        for index in range(1, items + 1):
+            stream.write(
+                f"  - id: {index}\n"
+                "    category: 1\n"
+                f"    model: model/{index}\n"
+                f"    name: Смартфон {index}\n"
+                f"    price: {1000 + index % 1000}\n"
+                "    price_rrc: 2000\n"
+                "    quantity: 5\n"
+                "    parameters:\n"
+                '      "Цвет": черный\n'
+                f'      "Встроенная память (Гб)": {index % 512}\n'
+            )
+
+
+class CatalogImportMemoryTest(SimpleTestCase):
+    """
+    Пиковая память импорта прайса не зависит от его размера. Импорт идет
+    в отдельном процессе с базой в файле, чтобы RSS не включал память
+    тестового процесса
+    """
+
+    def test_max_rss(self):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / "import_settings.py").write_text(
+                IMPORT_SETTINGS.format(name=str(directory / "db.sqlite3"))
+            )
+            write_price_list(directory / "price.yaml", IMPORT_MEMORY_ITEMS)
+            project = Path(__file__).resolve().parent.parent
+            result = subprocess.run(
+                [sys.executable, "-c", IMPORT_SCRIPT, str(directory / "price.yaml")],
+                cwd=project,
+                env={
+                    **os.environ,
+                    "DJANGO_SETTINGS_MODULE": "import_settings",
+                    "PYTHONPATH": os.pathsep.join((str(directory), str(project))),
+                },
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        baseline, peak = map(int, result.stdout.split())
+        self.assertLess((peak - baseline) / 1024, IMPORT_MEMORY_LIMIT)
+
+
+class ImportJobTest(TestCase):
+    """
+    Задача по новой ссылке получает название магазина из прайса и не идет
+    параллельно с импортом того же магазина, отчет видит только ее автор
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create(
+            email="shop@example.com", username="shop", type="shop"
+        )
+        self.job = ImportJob.objects.create(
+            user=self.owner,
+            shop_name="http://example.com/shop1.yaml",
+            url="http://example.com/shop1.yaml",
+            state="running",
+        )
+
+    def test_rekey(self):
+        rekey_job(self.job, "Связной")
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.shop_name, self.job.state), ("Связной", "running"))
+
+    def test_rekey_defers_busy_shop(self):
+        ImportJob.objects.create(
+            shop_name="Связной", filename="shop1.yaml", state="running"
+        )
+        with self.assertRaises(JobDeferred):
+            rekey_job(self.job, "Связной")
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.shop_name, self.job.state), ("Связной", "queued"))
+
+    def test_job_report_access(self):
+        buyer = User.objects.create(email="buyer@example.com", username="buyer")
+        other = User.objects.create(
+            email="other@example.com", username="other", type="shop"
+        )
+        client = APIClient()
+        url = f"/partner/update/{self.job.id}"
+        self.assertEqual(client.get(url).status_code, 403)
+        for user, status in ((buyer, 403), (other, 404), (self.owner, 200)):
+            client.credentials(
+                HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}"
+            )
+            self.assertEqual(client.get(url).status_code, status)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ImportByUrlTest(TestCase):
+    """
+    Импорт прайса по ссылке: первый запрос загружает каталог, повторный
+    получает 304 (If-Modified-Since) и импорт пропускается, force
+    загружает прайс заново
+    """
+
+    ITEMS = 20
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        write_price_list(Path(directory.name) / "shop.yaml", self.ITEMS)
+        server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), partial(QuietHandler, directory=directory.name)
+        )
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f"http://127.0.0.1:{server.server_port}/shop.yaml"
+
+    def run_import(self, force=False):
+        enqueue_import(url=self.url, force=force)
+        job = claim_job()
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.state, "done", job.errors)
+        return job
+
+    def test_import_by_url(self):
+        job = self.run_import()
+        shop = Shop.objects.get(name="Генератор")
+        self.assertEqual((job.shop_name, shop.url), ("Генератор", self.url))
+        self.assertEqual(job.report["Counts"]["inserted"], self.ITEMS)
+        self.assertEqual(ProductInfo.objects.filter(shop=shop).count(), self.ITEMS)
+
+        job = self.run_import()
+        self.assertEqual(job.report["NoOp"], "not_modified")
+
+        ProductInfo.objects.filter(shop=shop).update(price=1)
+        job = self.run_import(force=True)
+        self.assertNotIn("NoOp", job.report)
+        self.assertEqual(job.report["Counts"]["updated"], self.ITEMS)
@@ -0,0 +1,143 @@
+"""
+Суммы заказов: Order.total_sum и Order.items_count.
+
+Суммы хранятся в заказе, и списки заказов читают их без соединения с
+позициями и товарами. Операции с корзиной меняют суммы на разницу
+(orders.basket), при оформлении цены позиций фиксируются в OrderItem.price
+и сумма пересчитывается по ним. Пока цена не зафиксирована, позиция
+считается по текущей цене товара, поэтому изменение цен при импорте и в
+админке пересчитывает корзины с этими товарами. Команда
+reconcile_order_totals сверяет суммы со всеми позициями.
+"""
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from orders.models import Order, OrderItem, ProductInfo
+
+TOTALS_BATCH_SIZE = 1000
+
+
+def add_to_totals(order_id, total_sum, items_count):
+    """
+    Меняет суммы заказа на разницу после изменения его позиций и отмечает
+    изменение заказа: от updated_at зависит ETag корзины и списка заказов
+    """
+    Order.objects.filter(id=order_id).update(
+        total_sum=F("total_sum") + total_sum,
+        items_count=F("items_count") + items_count,
+        updated_at=timezone.now(),
+    )
+
+
+def item_totals(items):
+    """
+    (id заказа, сумма, количество товаров) по позициям items
+    """
+    return (
+        items.values("order_id")
+        .annotate(
+            total_sum=Sum(F("quantity") * Coalesce("price", "product_info__price")),
+            items_count=Sum("quantity"),
+        )
+        .values_list("order_id", "total_sum", "items_count")
+    )
+
+
+def order_totals(order_ids):
+    """
+    id заказа -> (сумма, количество товаров) по позициям заказа
+    """
+    totals = dict.fromkeys(order_ids, (0, 0))
+    for order_id, total_sum, items_count in item_totals(
+        OrderItem.objects.filter(order_id__in=order_ids)
+    ):
+        totals[order_id] = (total_sum, items_count)
+    return totals
+
+
+def shop_totals(order_ids, user_id):
+    """
+    id заказа -> (сумма, количество товаров) только по позициям магазина
+    пользователя user_id: поставщик не видит долю других магазинов в заказе
+    """
+    totals = dict.fromkeys(order_ids, (0, 0))
+    for order_id, total_sum, items_count in item_totals(
+        OrderItem.objects.filter(
+            order_id__in=order_ids, product_info__shop__user_id=user_id
+        )
+    ):
+        totals[order_id] = (total_sum, items_count)
+    return totals
+
+
+def update_totals(order_ids, batch_size=TOTALS_BATCH_SIZE):
+    """
+    Пересчитывает суммы заказов и записывает расходящиеся вместе с
+    updated_at, от которого зависит ETag списков заказов. Возвращает
+    расхождения: [(id заказа, сохраненные, пересчитанные)]
+    """
+    order_ids = list(order_ids)
+    drift = []
+    for start in range(0, len(order_ids), batch_size):
+        chunk = order_ids[start : start + batch_size]
+        totals = order_totals(chunk)
+        changed = []
+        now = timezone.now()
+        for order_id, total_sum, items_count in Order.objects.filter(
+            id__in=chunk
+        ).values_list("id", "total_sum", "items_count"):
+            if (total_sum, items_count) != totals[order_id]:
+                drift.append((order_id, (total_sum, items_count), totals[order_id]))
+                changed.append(
+                    Order(
+                        id=order_id,
+                        total_sum=totals[order_id][0],
+                        items_count=totals[order_id][1],
+                        updated_at=now,
+                    )
+                )
+        Order.objects.bulk_update(
+            changed, ["total_sum", "items_count", "updated_at"]
+        )
+    return drift
+
+
+def orders_with_items(product_info_ids, state=None):
+    """
+    id заказов с позициями товаров product_info_ids (только в статусе state)
+    """
+    orders = OrderItem.objects.filter(product_info_id__in=product_info_ids)
+    if state is not None:
+        orders = orders.filter(order__state=state)
+    return list(orders.values_list("order_id", flat=True).distinct())
+
+
+def refresh_basket_totals(product_info_ids, batch_size=TOTALS_BATCH_SIZE):
+    """
+    Пересчитывает корзины с товарами, у которых изменилась цена
+    """
+    product_info_ids = list(product_info_ids)
+    order_ids = set()
+    for start in range(0, len(product_info_ids), batch_size):
+        order_ids.update(
+            orders_with_items(
+                product_info_ids[start : start + batch_size], state="basket"
+            )
+        )
+    return update_totals(order_ids, batch_size)
+
+
+def freeze_prices(order_id):
+    """
+    Фиксирует текущие цены товаров в позициях заказа и пересчитывает
+    по ним сумму
+    """
+    OrderItem.objects.filter(order_id=order_id).update(
+        price=Subquery(
+            ProductInfo.objects.filter(id=OuterRef("product_info_id")).values(
+                "price"
+            )[:1]
+        )
+    )
+    update_totals([order_id])
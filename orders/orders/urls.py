@@ -22,22 +22,35 @@ from orders.views import (
     LoginAccount,
     RegisterAccount,
     ProductInfoView,
+    BestOfferView,
+    ProductCacheStats,
     BasketView,
     ContactView,
     OrderView,
     PartnerOrders,
+    PartnerExport,
     OrderNewView,
 )
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("partner/update", PartnerUpdate.as_view(), name="partner-update"),
+    path(
+        "partner/update/<int:job_id>",
+        PartnerUpdate.as_view(),
+        name="partner-update-job",
+    ),
     path("user/login", LoginAccount.as_view(), name="user-login"),
     path("user/register", RegisterAccount.as_view(), name="user-register"),
     path("products", ProductInfoView.as_view(), name="shops"),
+    path(
+        "products/best-offers", BestOfferView.as_view(), name="products-best-offers"
+    ),
+    path("products/cache", ProductCacheStats.as_view(), name="products-cache"),
     path("basket", BasketView.as_view(), name="basket"),
     path("user/contact", ContactView.as_view(), name="user-contact"),
     path("order", OrderView.as_view(), name="order"),
     path("partner/orders", PartnerOrders.as_view(), name="partner-orders"),
+    path("partner/export", PartnerExport.as_view(), name="partner-export"),
     path("order/new", OrderNewView.as_view(), name="order-new"),
 ]
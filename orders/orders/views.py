@@ -1,39 +1,180 @@
-from datetime import time, datetime
+from datetime import time, datetime, timedelta
 
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 from django.core.validators import URLValidator
 from django.db import IntegrityError
-from django.db.models import Q, Sum, F
-from django.http import JsonResponse
+from django.db.models import F, Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.authtoken.models import Token
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.core.exceptions import ValidationError
-from requests import get
-from yaml import load as load_yaml, Loader
 from ujson import loads as load_json
 
+from orders.basket import (
+    BasketError,
+    add_to_basket,
+    checkout,
+    remove_from_basket,
+    update_basket,
+)
+from orders.cache import (
+    cache_stats,
+    cached_catalog,
+    catalog_etag,
+    catalog_version,
+    conditional_response,
+    orders_etag,
+)
+from orders.documents import page_documents
+from orders.exporter import EXPORT_FORMATS
+from orders.fastpath import order_rows, render_json
+from orders.facets import (
+    facet_counts,
+    facet_summary,
+    parameter_filters,
+    parameter_query,
+)
+from orders.jobs import enqueue_import
 from orders.models import (
+    STATUS_CHOICES,
+    BestOffer,
+    ImportJob,
     Shop,
-    Category,
     ProductInfo,
-    Product,
-    Parameter,
-    ProductParameter,
     Order,
     OrderItem,
     Contact,
 )
+from orders.pagination import (
+    BestOfferPagination,
+    OrderHistoryPagination,
+    ProductInfoPagination,
+    ProductSearchPagination,
+)
+from orders.renderers import CatalogJSONRenderer, Documents
+from orders.search import search_index
 from orders.serializers import (
     UserSerializer,
-    ProductInfoSerializer,
     OrderSerializer,
-    OrderItemSerializer,
     ContactSerializer,
+    ProductInfoSerializer,
 )
-from orders.settings import MEDIA_ROOT
 from orders.signals import new_order, new_order_to_shop, new_user_registered
+from orders.totals import shop_totals
+
+
+def requested_fields(request, available):
+    """
+    Поля ответа из ?fields= и ?exclude= (через запятую) в порядке
+    сериализатора; None - все поля
+    """
+    fields = request.query_params.get("fields", "")
+    exclude = request.query_params.get("exclude", "")
+    selected = {name.strip() for name in fields.split(",") if name.strip()}
+    excluded = {name.strip() for name in exclude.split(",") if name.strip()}
+    unknown = (selected | excluded) - set(available)
+    if unknown:
+        raise ValueError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    fields = tuple(
+        name
+        for name in available
+        if (not selected or name in selected) and name not in excluded
+    )
+    return None if fields == tuple(available) else fields
+
+
+# параметр ordering каталога -> поле ProductInfo
+PRODUCT_ORDERING = {
+    "price": "price",
+    "price_rrc": "price_rrc",
+    "quantity": "quantity",
+    "name": "product__name",
+}
+
+
+def ordering_field(name):
+    field = name.lstrip("-")
+    return name[: len(name) - len(field)] + PRODUCT_ORDERING.get(field, field)
+
+
+def lookup_ids(value):
+    """
+    id товаров пакетного запроса: список или строка через запятую
+    """
+    if isinstance(value, str):
+        value = [product_info_id.strip() for product_info_id in value.split(",")]
+    if not isinstance(value, list) or not value:
+        raise ValueError("Не указан список ids")
+    ids = []
+    for product_info_id in value:
+        if isinstance(product_info_id, str) and product_info_id.isdigit():
+            product_info_id = int(product_info_id)
+        if type(product_info_id) != int or product_info_id < 0:
+            raise ValueError(f"Неверный id товара: {product_info_id}")
+        ids.append(product_info_id)
+    return ids
+
+
+def order_list_response(
+    request, orders, fields=None, paginator=None, shop_user_id=None
+):
+    """
+    Ответ со списком заказов в формате OrderSerializer. С FAST_SERIALIZATION
+    JSON собирается из values_list (orders.fastpath), browsable API всегда
+    рендерится сериализатором. С paginator курсор выбирает страницу по
+    id и dt, и позиции читаются только для заказов этой страницы.
+    С shop_user_id суммы заказов считаются только по позициям магазина
+    этого пользователя.
+    """
+    if paginator is not None:
+        page = paginator.paginate_queryset(orders.only("id", "dt"), request)
+        orders = Order.objects.filter(id__in=[order.id for order in page]).order_by(
+            *paginator.ordering
+        )
+    if settings.FAST_SERIALIZATION and request.accepted_renderer.format == "json":
+        data = order_rows(orders, fields, shop_user_id)
+        if paginator is not None:
+            data = {
+                "next": paginator.get_next_link(),
+                "previous": paginator.get_previous_link(),
+                "results": data,
+            }
+        return HttpResponse(render_json(data), content_type="application/json")
+    data = serialized_orders(orders, fields, shop_user_id)
+    if paginator is not None:
+        return paginator.get_paginated_response(data)
+    return Response(data)
+
+
+def serialized_orders(orders, fields=None, shop_user_id=None):
+    """
+    Связанные таблицы читаются, только если их поля есть в fields.
+    С shop_user_id сохраненные суммы заменяются суммами по позициям
+    магазина этого пользователя.
+    """
+    if fields is None or "ordered_items" in fields:
+        orders = orders.prefetch_related(
+            "ordered_items__product_info__product__category",
+            "ordered_items__product_info__product_parameters__parameter",
+        )
+    if fields is None or "contact" in fields:
+        orders = orders.select_related("contact")
+    serializer = OrderSerializer(orders.distinct(), many=True, fields=fields)
+    data = serializer.data
+    if shop_user_id is not None:
+        # serializer.instance уже прочитан и идет в том же порядке, что data
+        totals = shop_totals([order.id for order in serializer.instance], shop_user_id)
+        for order, row in zip(serializer.instance, data):
+            for name, value in zip(("total_sum", "items_count"), totals[order.id]):
+                if name in row:
+                    row[name] = value
+    return data
 
 
 class RegisterAccount(APIView):
@@ -123,83 +264,397 @@ class PartnerUpdate(APIView):
         # if request.user.type != 'shop':
         #     return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
-        # Load YAML data from the file
+        # ставим прайс в очередь, импорт выполняет воркер import_worker
         filename = request.data.get("filename")
-        if filename:
-            with open(f"{MEDIA_ROOT}{filename}.yaml", encoding="UTF-8") as fh:
-                data = load_yaml(fh, Loader=Loader)
-                # if url:
-                #     validate_url = URLValidator()
-                #     try:
-                #         validate_url(url)
-                #     except ValidationError as e:
-                #         return JsonResponse({'Status': False, 'Error': str(e)})
-                #     else:
-                #         stream = get(url).content
-
-                shop = Shop.objects.get_or_create(name=data["shop"])[0]
-                for category in data["categories"]:
-                    category_object = Category.objects.get_or_create(
-                        id=category["id"], name=category["name"]
-                    )[0]
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                if "goods" in data:
-                    for item in data["goods"]:
-                        product = Product.objects.get_or_create(
-                            name=item["name"], category_id=item["category"]
-                        )[0]
-                        product_info = ProductInfo.objects.create(
-                            product_id=product.id,
-                            id=item["id"],
-                            # model=item['model'],
-                            price=item["price"],
-                            price_rrc=item["price_rrc"],
-                            quantity=item["quantity"],
-                            shop_id=shop.id,
-                        )
-                        for name, value in item["parameters"].items():
-                            parameter_object = Parameter.objects.get_or_create(
-                                name=name
-                            )[0]
-                            ProductParameter.objects.create(
-                                product_info_id=product_info.id,
-                                parameter_id=parameter_object.id,
-                                value=value,
-                            )
-                return JsonResponse({"Status": True})
+        url = request.data.get("url")
+        if url:
+            validate_url = URLValidator()
+            try:
+                validate_url(url)
+            except ValidationError as e:
+                return JsonResponse({"Status": False, "Error": str(e)})
+        if filename or url:
+            try:
+                job = enqueue_import(
+                    filename=filename or "",
+                    url=url or "",
+                    format=request.data.get("format", "yaml"),
+                    mode=request.data.get("mode", "diff"),
+                    force=str(request.data.get("force", "")).lower()
+                    in ("1", "true", "yes"),
+                    user_id=request.user.id,
+                )
+            except (OSError, ValueError) as error:
+                return JsonResponse({"Status": False, "Errors": str(error)})
+            return JsonResponse({"Status": True, "Job": job.id})
         return JsonResponse({"Status": False, "Errors": "Не указано имя файла"})
 
+    # состояние задачи импорта
+    def get(self, request, job_id=None, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {"Status": False, "Error": "Log in required"}, status=403
+            )
+
+        if request.user.type != "shop":
+            return JsonResponse(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
+            )
+
+        if job_id is None:
+            return JsonResponse({"Status": False, "Errors": "Не указана задача"})
+        # поставщик видит только свои задачи
+        job = ImportJob.objects.filter(id=job_id, user_id=request.user.id).first()
+        if job is None:
+            return JsonResponse(
+                {"Status": False, "Errors": "Задача не найдена"}, status=404
+            )
+        return JsonResponse(
+            {
+                "Status": True,
+                "Job": {
+                    "id": job.id,
+                    "shop": job.shop_name,
+                    "state": job.state,
+                    "progress": job.progress,
+                    # причина пропуска импорта: not_modified или same_digest
+                    "noop": job.report.get("NoOp", ""),
+                    "counts": job.report.get("Counts", {}),
+                    "timings": job.report.get("Timings", {}),
+                    "errors": job.errors,
+                },
+            }
+        )
+
 
 class ProductInfoView(APIView):
     """
     Класс для поиска товаров
     """
 
+    # товары отдаются готовыми документами ProductInfoDocument
+    renderer_classes = (CatalogJSONRenderer, BrowsableAPIRenderer)
+
     def get(self, request, *args, **kwargs):
-        id = request.query_params.get("id")
-        shop_id = request.query_params.get("shop_id")
-        category_id = request.query_params.get("category_id")
+        if request.query_params.get("q", "").strip() and search_index() is None:
+            return JsonResponse(
+                {"Status": False, "Error": "Поиск не поддерживается базой данных"},
+                status=400,
+            )
+        try:
+            fields = requested_fields(request, ProductInfoSerializer.Meta.fields)
+            query = self.product_query(request)
+            ordering = self.product_ordering(request)
+            ids = request.query_params.get("ids")
+            if ids is not None:
+                ids = lookup_ids(ids)
+        except ValueError as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+        if ids is not None:
+            version = catalog_version()
+            return conditional_response(
+                request,
+                catalog_etag(request, version),
+                lambda: Response(
+                    cached_catalog(
+                        request, version, lambda: self.lookup_products(ids, fields)
+                    )
+                ),
+            )
+        # ответ кешируется до следующего импорта прайса магазина
+        version = catalog_version(request.query_params.get("shop_id"))
+        return conditional_response(
+            request,
+            catalog_etag(request, version),
+            lambda: Response(
+                cached_catalog(
+                    request,
+                    version,
+                    lambda: self.list_products(request, query, ordering, fields),
+                )
+            ),
+        )
+
+    # пакетный поиск товаров по id, список ids в теле запроса
+    def post(self, request, *args, **kwargs):
+        try:
+            fields = requested_fields(request, ProductInfoSerializer.Meta.fields)
+            ids = lookup_ids(request.data.get("ids"))
+        except ValueError as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+        return Response(self.lookup_products(ids, fields))
+
+    def lookup_products(self, ids, fields=None):
+        """
+        Товары в порядке ids (с повторами) за одно чтение документов, не
+        считая сборки отсутствующих документов. Ненайденные и снятые с
+        продажи товары отдаются отметкой с id и перечисляются в not_found.
+        """
+        product_infos = list(
+            self.load_fields(
+                ProductInfo.objects.filter(is_active=True, id__in=set(ids)), fields
+            )
+        )
+        found = [product_info.id for product_info in product_infos]
+        missing = set(ids).difference(found)
+        not_found = [
+            product_info_id
+            for product_info_id in dict.fromkeys(ids)
+            if product_info_id in missing
+        ]
+        markers = {
+            product_info_id: {
+                "id": product_info_id,
+                "Status": False,
+                "Error": "Товар не найден",
+            }
+            for product_info_id in not_found
+        }
+        if fields is None:
+            items = dict(zip(found, page_documents(product_infos)))
+            markers = {
+                product_info_id: render_json(marker)
+                for product_info_id, marker in markers.items()
+            }
+            results = Documents(
+                items.get(product_info_id) or markers[product_info_id]
+                for product_info_id in ids
+            )
+        else:
+            items = dict(zip(found, self.results(product_infos, fields)))
+            results = [
+                items.get(product_info_id) or markers[product_info_id]
+                for product_info_id in ids
+            ]
+        return {"results": results, "not_found": not_found}
+
+    def product_query(self, request):
+        query = Q(is_active=True)
+        for name, lookup in (
+            ("id", "id"),
+            ("shop_id", "shop_id"),
+            ("category_id", "product__category_id"),
+            ("price_min", "price__gte"),
+            ("price_max", "price__lte"),
+        ):
+            value = request.query_params.get(name, "")
+            if value:
+                if not value.isdigit():
+                    raise ValueError(f"Неверное значение {name}: {value}")
+                query = query & Q(**{lookup: int(value)})
+        in_stock = str(request.query_params.get("in_stock", "")).lower()
+        if in_stock in ("1", "true", "yes"):
+            query = query & Q(quantity__gt=0)
+        return query & parameter_query(parameter_filters(request.query_params))
+
+    def product_ordering(self, request):
+        """
+        Сортировка из ?ordering= (минус - по убыванию); при равных значениях
+        товары идут по id, чтобы курсор страниц был однозначным
+        """
+        ordering = request.query_params.get("ordering", "")
+        if not ordering:
+            return None
+        if ordering.lstrip("-") not in PRODUCT_ORDERING:
+            raise ValueError(f"Неверная сортировка: {ordering}")
+        return ordering, "-id" if ordering.startswith("-") else "id"
+
+    def list_products(self, request, query, ordering=None, fields=None):
+        search = request.query_params.get("q", "").strip()
+        if search:
+            return self.search_products(request, query, search, ordering, fields)
+
+        # курсор читает значение сортировки из атрибута строки, поэтому
+        # столбец сортировки читается вместе со страницей
+        field = ordering[0].lstrip("-") if ordering is not None else None
+        # фильтры не размножают строки, поэтому distinct не нужен
+        queryset = self.load_fields(
+            ProductInfo.objects.filter(query),
+            fields,
+            [field] if field not in (None, "name") else [],
+        )
+        if field == "name":
+            queryset = queryset.annotate(name=F("product__name"))
+
+        paginator = ProductInfoPagination()
+        if ordering is not None:
+            paginator.ordering = ordering
+        page = paginator.paginate_queryset(queryset, request, view=self)
+
+        return self.with_facets(
+            request,
+            paginator.get_paginated_response(self.results(page, fields)).data,
+            ProductInfo.objects.filter(query),
+        )
+
+    def load_fields(self, queryset, fields, columns=()):
+        """
+        Все поля отдаются готовыми документами; для части полей читаются
+        только их столбцы, а связанные таблицы - только если они запрошены.
+        columns - дополнительные столбцы ProductInfo (например, сортировки).
+        """
+        if fields is None:
+            return queryset.select_related("document").only(
+                "id", "document__document", *columns
+            )
+        columns = ["id", *columns] + [
+            name
+            for name in ("shop", "quantity", "price", "price_rrc")
+            if name in fields
+        ]
+        if "product" in fields:
+            queryset = queryset.select_related("product__category")
+            columns += ["product__name", "product__category__name"]
+        if "product_parameters" in fields:
+            queryset = queryset.prefetch_related("product_parameters__parameter")
+        return queryset.only(*columns)
+
+    def results(self, page, fields):
+        if fields is None:
+            return page_documents(page)
+        return ProductInfoSerializer(page, many=True, fields=fields).data
+
+    def with_facets(self, request, data, product_infos):
+        """
+        С facets=1 добавляет к ответу счетчики значений параметров по всем
+        товарам выборки product_infos (не только текущей страницы). Если
+        запрос ограничен только магазином и категорией, счетчики берутся
+        из ParameterFacet
+        """
+        if str(request.query_params.get("facets", "")).lower() in ("1", "true", "yes"):
+            if self.filtered(request):
+                data["facets"] = facet_counts(product_infos)
+            else:
+                data["facets"] = facet_summary(
+                    request.query_params.get("shop_id"),
+                    request.query_params.get("category_id"),
+                )
+        return data
+
+    def filtered(self, request):
+        """
+        Есть ли в запросе фильтры, кроме магазина и категории
+        """
+        params = request.query_params
+        in_stock = str(params.get("in_stock", "")).lower()
+        return (
+            any(params.get(name) for name in ("id", "price_min", "price_max"))
+            or bool(params.get("q", "").strip())
+            or in_stock in ("1", "true", "yes")
+            or bool(parameter_filters(params))
+        )
+
+    def search_products(self, request, query, search, ordering=None, fields=None):
+        """
+        Индекс отдает id по убыванию релевантности, фильтры применяются в
+        том же запросе к индексу, сортировка (если она задана) - одним
+        запросом к найденным id, затем читается только текущая страница
+        """
+        ids = search_index().search(search, ProductInfo.objects.filter(query))
+        if ordering is not None:
+            ids = list(
+                ProductInfo.objects.filter(id__in=ids)
+                .order_by(*map(ordering_field, ordering))
+                .values_list("id", flat=True)
+            )
+        position = {
+            product_info_id: index for index, product_info_id in enumerate(ids)
+        }
+
+        paginator = ProductSearchPagination()
+        page = paginator.paginate_queryset(ids, request, view=self)
+        products = sorted(
+            self.load_fields(ProductInfo.objects.filter(id__in=page), fields),
+            key=lambda product_info: position[product_info.id],
+        )
+
+        return self.with_facets(
+            request,
+            paginator.get_paginated_response(self.results(products, fields)).data,
+            ProductInfo.objects.filter(id__in=ids),
+        )
+
+
+class BestOfferView(APIView):
+    """
+    Класс для просмотра самых дешевых предложений продуктов среди магазинов
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            query = self.offer_query(request)
+        except ValueError as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+        # BestOffer меняется вместе с каталогом, кеш общий для всех магазинов
+        version = catalog_version()
+        return conditional_response(
+            request,
+            catalog_etag(request, version),
+            lambda: Response(
+                cached_catalog(
+                    request, version, lambda: self.list_offers(request, query)
+                )
+            ),
+        )
+
+    def offer_query(self, request):
         query = Q()
-        if id:
-            query = query & Q(id=id)
-        if shop_id:
-            query = query & Q(shop_id=shop_id)
+        product_ids = request.query_params.get("product_id", "")
+        if product_ids:
+            product_ids = product_ids.split(",")
+            if not all(product_id.isdigit() for product_id in product_ids):
+                raise ValueError("Неверный список product_id")
+            query = query & Q(product_id__in=product_ids)
+        category_id = request.query_params.get("category_id")
         if category_id:
-            query = query & Q(product__category_id=category_id)
-
-        # фильтруем и отбрасываем дубликаты
-        queryset = (
-            ProductInfo.objects.filter(query)
-            .select_related("shop", "product__category")
-            .prefetch_related("product_parameters__parameter")
-            .distinct()
+            if not category_id.isdigit():
+                raise ValueError(f"Неверное значение category_id: {category_id}")
+            query = query & Q(product__category_id=int(category_id))
+        return query
+
+    def list_offers(self, request, query):
+        # одна выборка по первичному ключу BestOffer с названием продукта
+        offers = BestOffer.objects.filter(query).values(
+            "product_id",
+            "product__name",
+            "product_info_id",
+            "shop_id",
+            "price",
+            "offers",
         )
+        paginator = BestOfferPagination()
+        page = paginator.paginate_queryset(offers, request, view=self)
+        return paginator.get_paginated_response(
+            [
+                {
+                    "product": offer["product_id"],
+                    "name": offer["product__name"],
+                    "product_info": offer["product_info_id"],
+                    "shop": offer["shop_id"],
+                    "price": offer["price"],
+                    "offers": offer["offers"],
+                }
+                for offer in page
+            ]
+        ).data
+
+
+class ProductCacheStats(APIView):
+    """
+    Класс для просмотра счетчиков кеша каталога
+    """
 
-        serializer = ProductInfoSerializer(queryset, many=True)
-
-        return Response(serializer.data)
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {"Status": False, "Error": "Log in required"}, status=403
+            )
+        if not request.user.is_staff:
+            return JsonResponse(
+                {"Status": False, "Error": "Только для администраторов системы"},
+                status=403,
+            )
+        return JsonResponse({"Status": True, **cache_stats()})
 
 
 class BasketView(APIView):
@@ -213,24 +668,17 @@ class BasketView(APIView):
             return JsonResponse(
                 {"Status": False, "Error": "Log in required"}, status=403
             )
-        basket = (
-            Order.objects.filter(user_id=request.user.id, state="basket")
-            .prefetch_related(
-                "ordered_items__product_info__product__category",
-                "ordered_items__product_info__product_parameters__parameter",
-            )
-            .annotate(
-                total_sum=Sum(
-                    F("ordered_items__quantity")
-                    * F("ordered_items__product_info__price")
-                )
-            )
-            .distinct()
+        try:
+            fields = requested_fields(request, OrderSerializer.Meta.fields)
+        except ValueError as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+        basket = Order.objects.filter(user_id=request.user.id, state="basket")
+        return conditional_response(
+            request,
+            orders_etag(request, basket),
+            lambda: order_list_response(request, basket, fields),
         )
 
-        serializer = OrderSerializer(basket, many=True)
-        return Response(serializer.data)
-
     # редактировать корзину
     def post(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -246,30 +694,19 @@ class BasketView(APIView):
                 return JsonResponse(
                     {"Status": False, "Errors": "Неверный формат запроса"}
                 )
-            else:
-                basket = Order.objects.get_or_create(
-                    user_id=request.user.id, state="basket"
-                )[0]
-                objects_created = 0
-                for order_item in items_dict:
-                    order_item.update({"order": basket.id})
-                    serializer = OrderItemSerializer(data=order_item)
-                    if serializer.is_valid():
-                        try:
-                            serializer.save()
-                        except IntegrityError as error:
-                            return JsonResponse({"Status": False, "Errors": str(error)})
-                        else:
-                            objects_created += 1
-
-                    else:
-                        return JsonResponse(
-                            {"Status": False, "Errors": serializer.errors}
-                        )
-
-                return JsonResponse(
-                    {"Status": True, "Создано объектов": objects_created}
+            try:
+                objects_created, objects_updated = add_to_basket(
+                    request.user.id, items_dict
                 )
+            except BasketError as error:
+                return JsonResponse({"Status": False, "Errors": error.errors})
+            return JsonResponse(
+                {
+                    "Status": True,
+                    "Создано объектов": objects_created,
+                    "Обновлено объектов": objects_updated,
+                }
+            )
         return JsonResponse(
             {"Status": False, "Errors": "Не указаны все необходимые аргументы"}
         )
@@ -283,20 +720,16 @@ class BasketView(APIView):
 
         items_string = request.data.get("items")
         if items_string:
-            items_list = items_string.split(",")
-            basket = Order.objects.get_or_create(
-                user_id=request.user.id, state="basket"
-            )[0]
-            query = Q()
-            objects_deleted = False
-            for order_item_id in items_list:
-                if order_item_id.isdigit():
-                    query = query | Q(order_id=basket.id, id=order_item_id)
-                    objects_deleted = True
-
-            if objects_deleted:
-                deleted_count = OrderItem.objects.filter(query).delete()[0]
-                return JsonResponse({"Status": True, "Удалено объектов": deleted_count})
+            deleted_count, rejected = remove_from_basket(
+                request.user.id, items_string.split(",")
+            )
+            return JsonResponse(
+                {
+                    "Status": True,
+                    "Удалено объектов": deleted_count,
+                    "Отклонено": rejected,
+                }
+            )
         return JsonResponse(
             {"Status": False, "Errors": "Не указаны все необходимые аргументы"}
         )
@@ -316,23 +749,19 @@ class BasketView(APIView):
                 return JsonResponse(
                     {"Status": False, "Errors": "Неверный формат запроса"}
                 )
-            else:
-                basket = Order.objects.get_or_create(
-                    user_id=request.user.id, state="basket"
-                )[0]
-                objects_updated = 0
-                for order_item in items_dict:
-                    if (
-                        type(order_item["id"]) == int
-                        and type(order_item["quantity"]) == int
-                    ):
-                        objects_updated += OrderItem.objects.filter(
-                            order_id=basket.id, id=order_item["id"]
-                        ).update(quantity=order_item["quantity"])
-
-                return JsonResponse(
-                    {"Status": True, "Обновлено объектов": objects_updated}
+            try:
+                objects_updated, rejected = update_basket(
+                    request.user.id, items_dict
                 )
+            except BasketError as error:
+                return JsonResponse({"Status": False, "Errors": error.errors})
+            return JsonResponse(
+                {
+                    "Status": True,
+                    "Обновлено объектов": objects_updated,
+                    "Отклонено": rejected,
+                }
+            )
         return JsonResponse(
             {"Status": False, "Errors": "Не указаны все необходимые аргументы"}
         )
@@ -439,25 +868,75 @@ class OrderView(APIView):
             return JsonResponse(
                 {"Status": False, "Error": "Log in required"}, status=403
             )
-        order = (
-            Order.objects.filter(user_id=request.user.id)
-            .exclude(state="basket")
-            .prefetch_related(
-                "ordered_items__product_info__product__category",
-                "ordered_items__product_info__product_parameters__parameter",
-            )
-            .select_related("contact")
-            .annotate(
-                total_sum=Sum(
-                    F("ordered_items__quantity")
-                    * F("ordered_items__product_info__price")
-                )
+        try:
+            fields = requested_fields(request, OrderSerializer.Meta.fields)
+            query = self.order_query(request)
+        except ValueError as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+        summary = str(request.query_params.get("summary", "")).lower()
+        if summary in ("1", "true", "yes"):
+            # без позиций: список читается из одной таблицы заказов
+            fields = tuple(
+                name
+                for name in fields or OrderSerializer.Meta.fields
+                if name != "ordered_items"
             )
-            .distinct()
+        orders = Order.objects.filter(query, user_id=request.user.id).exclude(
+            state="basket"
+        )
+        return conditional_response(
+            request,
+            orders_etag(request, orders),
+            lambda: order_list_response(
+                request, orders, fields, OrderHistoryPagination()
+            ),
         )
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+    def order_query(self, request):
+        """
+        Фильтры истории заказов: state= (через запятую), dt_from= и dt_to=
+        (дата или дата и время ISO 8601; дата в dt_to включается целиком)
+        """
+        query = Q()
+        states = request.query_params.get("state", "")
+        if states:
+            states = states.split(",")
+            # корзина в историю заказов не входит
+            unknown = set(states) - {
+                state for state, _ in STATUS_CHOICES if state != "basket"
+            }
+            if unknown:
+                raise ValueError(f"Неверный статус: {', '.join(sorted(unknown))}")
+            query = query & Q(state__in=states)
+        for name, lookup, next_day in (
+            ("dt_from", "dt__gte", False),
+            ("dt_to", "dt__lt", True),
+        ):
+            value = request.query_params.get(name, "")
+            if value:
+                query = query & Q(**{lookup: self.parse_dt(name, value, next_day)})
+        return query
+
+    def parse_dt(self, name, value, next_day):
+        # дата без времени проверяется первой: parse_datetime на Python 3.11
+        # принимает и ее, возвращая полночь
+        try:
+            day = parse_date(value)
+            dt = parse_datetime(value) if day is None else None
+        except ValueError:
+            day = dt = None
+        if day is not None:
+            if next_day:
+                day += timedelta(days=1)
+            dt = datetime.combine(day, time())
+        elif dt is None:
+            raise ValueError(f"Неверное значение {name}: {value}")
+        elif next_day:
+            # dt_to с временем включается как есть
+            dt += timedelta(microseconds=1)
+        if timezone.is_naive(dt):
+            dt = timezone.make_aware(dt)
+        return dt
 
     # разместить заказ из корзины
     def post(self, request, *args, **kwargs):
@@ -468,10 +947,12 @@ class OrderView(APIView):
         if {"id", "contact"}.issubset(request.data):
             if request.data["id"].isdigit():
                 try:
-                    is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data["id"], state="basket"
-                    ).update(contact_id=request.data["contact"], state="new")
-                except IntegrityError as error:
+                    is_updated = checkout(
+                        request.user.id, request.data["id"], request.data["contact"]
+                    )
+                except BasketError as error:
+                    return JsonResponse({"Status": False, "Errors": error.errors})
+                except (IntegrityError, ValueError):
                     return JsonResponse(
                         {"Status": False, "Errors": "Неправильно указаны аргументы"}
                     )
@@ -505,27 +986,55 @@ class PartnerOrders(APIView):
                 {"Status": False, "Error": "Только для магазинов"}, status=403
             )
 
-        order = (
-            Order.objects.filter(
-                ordered_items__product_info__shop__user_id=request.user.id
+        try:
+            fields = requested_fields(request, OrderSerializer.Meta.fields)
+        except ValueError as error:
+            return JsonResponse({"Status": False, "Errors": str(error)}, status=400)
+        # сумма заказа считается только по позициям магазина пользователя
+        order = Order.objects.filter(
+            ordered_items__product_info__shop__user_id=request.user.id
+        ).exclude(state="basket")
+        return order_list_response(
+            request, order, fields, shop_user_id=request.user.id
+        )
+
+
+class PartnerExport(APIView):
+    """
+    Класс для выгрузки каталога поставщика
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {"Status": False, "Error": "Log in required"}, status=403
             )
-            .exclude(state="basket")
-            .prefetch_related(
-                "ordered_items__product_info__product__category",
-                "ordered_items__product_info__product_parameters__parameter",
+
+        if request.user.type != "shop":
+            return JsonResponse(
+                {"Status": False, "Error": "Только для магазинов"}, status=403
             )
-            .select_related("contact")
-            .annotate(
-                total_sum=Sum(
-                    F("ordered_items__quantity")
-                    * F("ordered_items__product_info__price")
-                )
+
+        shop = Shop.objects.filter(user_id=request.user.id).first()
+        if shop is None:
+            return JsonResponse({"Status": False, "Errors": "Магазин не найден"})
+
+        # параметр format занят выбором рендерера DRF
+        format = request.query_params.get("type", "yaml")
+        if format not in EXPORT_FORMATS:
+            return JsonResponse(
+                {"Status": False, "Errors": f"Неизвестный формат выгрузки: {format}"}
             )
-            .distinct()
-        )
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        # файл отдается частями по мере чтения каталога из базы
+        chunks, content_type = EXPORT_FORMATS[format]
+        response = StreamingHttpResponse(
+            chunks(shop), content_type=f"{content_type}; charset=utf-8"
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shop{shop.id}.{format}"'
+        )
+        return response
 
 
 class OrderNewView(APIView):
@@ -548,7 +1057,7 @@ class OrderNewView(APIView):
                 try:
                     is_updated = Order.objects.filter(
                         id=request.data["id"], state="new"
-                    ).update(state="confirmed")
+                    ).update(state="confirmed", updated_at=timezone.now())
                 except IntegrityError as error:
                     return JsonResponse(
                         {"Status": False, "Errors": "Неправильно указаны аргументы"}